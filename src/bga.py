@@ -1,30 +1,104 @@
 """Module for handling connections to Board Game Arena."""
 
+import hashlib
+import json
 import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from functools import cache
-
-import requests
-from cachetools.func import ttl_cache
+from typing import TYPE_CHECKING, Any, Callable, Optional, Sequence
 
 from src.cs.duel import Duel
+from src.rate_limit import TokenBucket
 from src.settings import config, logger
+from src.shared_cache import SharedCache, cache_ttl
+from src.store import verdict_store
+from src.transport import mount
+
+if TYPE_CHECKING:
+    import requests
+
+SESSION_KEY = "session"
+DAY = 24 * 3600  # in seconds
+WINDOW_DAYS = 1  # Days before outcome submission where games are looked for
+LATE_WINDOW_DAYS = 3  # Same, when games are not found, submitted late maybe
+WORKERS = 4  # Requests to BGA in flight at once
+MAX_PAGES = 10  # Pages of a history followed, duels are checked one by one past it
+PAGE_SIZE = 10  # Tables in a full getGames page, a shorter one is the last
 
-CACHE_TTL = 3600  # in seconds
+Table = dict[str, Any]
 
 
 @cache
 class BGA:
-    """Handles connections to BGA to fetch games outcome."""
+    """Handles connections to BGA to fetch games outcome.
+
+    Every request goes through a single rate limiter, letting one request
+    through every bga.interval seconds, whichever thread sends it.
+    """
+
+    def __init__(self):
+        """Set up the rate limiter and the session store."""
+        interval = float(config["bga"]["interval"])
+        self._limiter = TokenBucket(1 / interval if interval > 0 else 0)
+        self._cache = SharedCache("bga")
+        self._session: Optional["requests.Session"] = None
+        self._state: Optional[bytes] = None
+        self._lock = threading.Lock()
 
     @property
-    @ttl_cache(ttl=CACHE_TTL)
-    def session(self) -> requests.Session:
+    def session(self) -> "requests.Session":
         """Create a session in BGA so I can make requests.
 
-        Logs in, set headers appropriately, return session.
+        Cookies and request token of the login are kept in the shared cache
+        and reused, by every process, until BGA rejects them. A stored
+        session is checked with a cheap probe the first time a process
+        uses it, so a stale one costs a request instead of a failed batch.
+        """
+        with self._lock:
+            if self._session is None:
+                logged_in: list[bool] = []
+
+                def _login() -> bytes:
+                    logged_in.append(True)
+                    return self._login()
+
+                ttl = cache_ttl("bga_session", float("inf"))
+                state = self._cache.get_or_set(SESSION_KEY, ttl, _login)
+                session = _session(state)
+                if not logged_in and not self._probe(session):
+                    logger.info("Stored BGA session rejected, logging in again")
+                    state = self._cache.refresh(SESSION_KEY, state, self._login)
+                    session = _session(state)
+
+                self._session, self._state = session, state
+
+            return self._session
+
+    def _probe(self, session: "requests.Session") -> bool:
+        """Check a session is accepted by BGA with a tiny request."""
+        self._limiter.acquire()
+        return not _rejected(session.get(config["bga"]["urls"]["probe"]))
+
+    def _relogin(self, state: Optional[bytes]):
+        """Log in again after BGA rejected the session made from state.
+
+        Threads and processes finding the same session rejected
+        log in just once, the rest use the new session.
         """
+        with self._lock:
+            if state is not None and self._state != state:
+                return  # Another thread already logged in again
+
+            state = self._cache.refresh(SESSION_KEY, state, self._login)
+            self._session, self._state = _session(state), state
+
+    def _login(self) -> bytes:
+        """Log in, return cookies and request token of the session as JSON."""
+        import requests  # pylint: disable=import-outside-toplevel
+
         bga = config["bga"]
-        s = requests.Session()
+        s = mount(requests.Session(), "bga")
 
         # First need to fetch some page in order to get request token for login
         # Note: Using a very poor method to extract CSRF ID but... meh
@@ -43,26 +117,184 @@ class BGA:
         # But before doing anything else I need to get csrf id
         r = s.get(bga["urls"]["csrf"])
         csrf_id = re.findall("requestToken:\\ '(.*)'", r.text)[0]  # Bad :(
-        s.headers["X-Request-Token"] = csrf_id
 
-        # Finally I can return a session that can be used
-        return s
+        # Finally I can return what makes a session that can be used
+        cookies = [
+            {"name": c.name, "value": c.value, "domain": c.domain, "path": c.path}
+            for c in s.cookies
+        ]
+        return json.dumps({"cookies": cookies, "token": csrf_id}).encode("utf-8")
 
-    # pylint: disable=too-many-locals, too-many-return-statements, too-many-branches
     def check_duel(self, duel: Duel) -> bool:
         """Check submitted outcome for single duel matches reality."""
-        if duel.outcome_timestamp is None:
-            raise RuntimeError("Duel not played, something went wrong")
+        return self._check_pair(duel)[0]
+
+    def _check_pair(self, duel: Duel) -> tuple[bool, list[Table]]:
+        """Check a duel querying games between its players, return tables used."""
+        used: dict[str, Table] = {}
+
+        def _tables_for(days: int) -> list[Table]:
+            tables = self._duel_tables(duel, days)
+            used.update((table["table_id"], table) for table in tables)
+            return tables
+
+        right = self._check_tables(duel, _tables_for)
+        return right, list(used.values())
+
+    def check_duels(self, duels: Sequence[Duel], recheck: bool = False) -> list[bool]:
+        """Check submitted outcome for several duels, same as check_duel.
+
+        Verdicts are kept, along with the tables they were based on, keyed
+        by the content of the duel. Duels already found right are not
+        checked again, unless recheck, while new or edited outcomes are.
+        """
+        store = verdict_store()
+        keys = [_verdict_key(duel) for duel in duels]
+        known = store.load_verdicts(keys) if store and not recheck else {}
+        todo = [idx for idx, key in enumerate(keys) if not known.get(key)]
+        logger.info(
+            "%d of %d duels already checked", len(duels) - len(todo), len(duels)
+        )
+
+        checks = [True] * len(duels)
+        verdicts: list[tuple[str, bool, str]] = []
+        results = self._check_batch([duels[idx] for idx in todo])
+        for idx, (right, tables) in zip(todo, results):
+            checks[idx] = right
+            verdicts.append((keys[idx], right, json.dumps(tables)))
+
+        if store and verdicts:
+            store.save_verdicts(verdicts)
+
+        return checks
+
+    def _check_batch(self, duels: Sequence[Duel]) -> list[tuple[bool, list[Table]]]:
+        """Check duels against BGA, return verdicts and tables used for them.
+
+        Instead of querying the games of every duel, the history of as few
+        players as possible is fetched, covering every duel, and duels are
+        checked against the tables found there. A player playing several
+        duels in a few days needs a single query for all of them.
+
+        Queries are sent from a thread pool, so their latency overlaps
+        while the rate limiter keeps the configured request rate.
+
+        Histories come in pages. Duels of a history with more than
+        MAX_PAGES pages are checked one by one, querying their players.
+        """
+        assigned, queries = _plan_history(duels)
+        history, incomplete = self._histories(queries)
+        logger.info("Fetched %d histories for %d duels", len(queries), len(duels))
+
+        return [
+            (
+                self._check_pair(duel)
+                if player in incomplete
+                else self._check_history(duel, player, history[player])
+            )
+            for duel, player in zip(duels, assigned)
+        ]
+
+    def _histories(
+        self, queries: Sequence[tuple[int, int, int]]
+    ) -> tuple[dict[int, dict[str, Table]], set[int]]:
+        """Run (player, start, end) history queries from a thread pool.
+
+        Returns tables found keyed by player and table id,
+        and players with some history left unfetched.
+        """
+        if queries:
+            _ = self.session  # Log in once, before workers need it
+
+        url = config["bga"]["urls"]["history"]
+        history: dict[int, dict[str, Table]] = {}
+        incomplete: set[int] = set()
+        workers = int(config["bga"].get("workers", WORKERS))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            urls = [url.format(*query) for query in queries]
+            results = executor.map(self._history, urls)
+            for (player_id, _, _), (tables, complete) in zip(queries, results):
+                player_history = history.setdefault(player_id, {})
+                for table in tables:
+                    player_history[table["table_id"]] = table
+                if not complete:
+                    incomplete.add(player_id)
+
+        return history, incomplete
+
+    def _history(self, url: str) -> tuple[list[Table], bool]:
+        """Fetch the pages of a history, until one is not full.
+
+        Returns the tables, and whether every page was fetched,
+        which is not the case when there are more than MAX_PAGES.
+        """
+        tables: dict[str, Table] = {}
+        for page in range(1, MAX_PAGES + 1):
+            found = self._tables(f"{url}&page={page}")
+            tables.update((table["table_id"], table) for table in found)
+            if len(found) < PAGE_SIZE:
+                return list(tables.values()), True
+
+        logger.warning("History with more than %d pages: %s", MAX_PAGES, url)
+        return list(tables.values()), False
+
+    def _check_history(
+        self, duel: Duel, player_id: int, history: dict[str, Table]
+    ) -> tuple[bool, list[Table]]:
+        """Check a duel against the history of a player, return tables used."""
+        used: dict[str, Table] = {}
 
-        base_date = round(duel.outcome_timestamp.timestamp())
-        start_date = str(base_date - 24 * 1 * 3600)
-        end_date = str(base_date + 24 * 1 * 3600)
+        def _tables_for(days: int) -> list[Table]:
+            tables = _duel_history(duel, player_id, history, days)
+            used.update((table["table_id"], table) for table in tables)
+            return tables
 
+        right = self._check_tables(duel, _tables_for)
+        return right, list(used.values())
+
+    def _duel_tables(self, duel: Duel, days: int) -> list[Table]:
+        """Fetch tables for a duel played within days before outcome was submitted."""
+        start_date, end_date = _window(duel, days)
         url = config["bga"]["urls"]["outcome"]
         url = url.format(duel.p1.id, duel.p2.id, start_date, end_date)
 
-        r = self.session.get(url)
-        tables = r.json()["data"]["tables"]
+        return self._tables(url)
+
+    def _tables(self, url: str) -> list[Table]:
+        """Fetch tables from a getGames URL, waiting for the rate limiter.
+
+        Logs in again, and retries, once if BGA rejects the session.
+        """
+        for attempt in range(2):
+            self._limiter.acquire()
+            session, state = self.session, self._state
+            r = session.get(url)
+            if not _rejected(r):
+                return r.json()["data"]["tables"]
+
+            if not attempt:
+                logger.info("BGA session rejected, logging in again")
+                self._relogin(state)
+
+        raise RuntimeError(f"BGA rejected request {url}")
+
+    # pylint: disable=too-many-return-statements, too-many-branches
+    def _check_tables(
+        self, duel: Duel, tables_for: Callable[[int], list[Table]]
+    ) -> bool:
+        """Check submitted outcome for single duel matches its tables.
+
+        Parameters
+        ----------
+            duel Duel to check.
+            tables_for Return tables of the duel played within a number
+                       of days before the outcome was submitted.
+                       elo_win of tables is the one of the first player.
+        """
+        if duel.outcome_timestamp is None:
+            raise RuntimeError("Duel not played, something went wrong")
+
+        tables = tables_for(WINDOW_DAYS)
         tables = [table for table in tables if table["arena_win"] is None]
 
         if len(tables) > 3:
@@ -82,13 +314,7 @@ class BGA:
 
         if len(tables) < 2:
             # Try older games, maybe game results were submitted late
-            start_date = str(base_date - 24 * 3 * 3600)
-
-            url = config["bga"]["urls"]["outcome"]
-            url = url.format(duel.p1.id, duel.p2.id, start_date, end_date)
-
-            r = self.session.get(url)
-            tables = r.json()["data"]["tables"]
+            tables = tables_for(LATE_WINDOW_DAYS)
 
             if len(tables) < 2:
                 # Dunno where are the games
@@ -124,3 +350,118 @@ class BGA:
             return False
 
         return True
+
+    # pylint: enable=too-many-return-statements, too-many-branches
+
+
+def _verdict_key(duel: Duel) -> str:
+    """Return a key for the verdict of a duel, changing if its outcome does."""
+    assert duel.outcome_timestamp is not None
+    content = [
+        duel.p1.id,
+        duel.p2.id,
+        duel.p1_score,
+        duel.p2_score,
+        duel.outcome_timestamp.timestamp(),
+        duel.played_for_real,
+    ]
+    return hashlib.sha1(json.dumps(content).encode("utf-8")).hexdigest()
+
+
+def _session(state: bytes) -> "requests.Session":
+    """Build a session from stored cookies and request token."""
+    import requests  # pylint: disable=import-outside-toplevel
+
+    cnf = json.loads(state)
+    s = mount(requests.Session(), "bga")
+    for cookie in cnf["cookies"]:
+        s.cookies.set(**cookie)
+    s.headers["X-Request-Token"] = cnf["token"]
+
+    return s
+
+
+def _rejected(r: "requests.Response") -> bool:
+    """Check whether BGA rejected a request for lack of a valid session."""
+    if r.status_code in (401, 403):
+        return True
+
+    try:
+        body = r.json()
+    except ValueError:
+        return True  # Not logged in requests get the login page
+
+    return str(body.get("status", "1")) == "0"
+
+
+def _window(duel: Duel, days: int) -> tuple[int, int]:
+    """Return BGA query window for a duel, days before and one after outcome."""
+    assert duel.outcome_timestamp is not None
+    base_date = round(duel.outcome_timestamp.timestamp())
+    return base_date - days * DAY, base_date + DAY
+
+
+def _plan_history(
+    duels: Sequence[Duel],
+) -> tuple[list[int], list[tuple[int, int, int]]]:
+    """Plan history queries covering duels.
+
+    Duels are assigned greedily to the player covering most of the ones left,
+    then windows of the duels of a player are merged when they overlap.
+
+    Returns
+    -------
+    Player assigned to each duel and (player, start, end) queries to run.
+    """
+    windows: list[tuple[int, int]] = []
+    by_player: dict[int, set[int]] = {}
+    for idx, duel in enumerate(duels):
+        if duel.outcome_timestamp is None:
+            raise RuntimeError("Duel not played, something went wrong")
+        windows.append(_window(duel, LATE_WINDOW_DAYS))
+        by_player.setdefault(duel.p1.id, set()).add(idx)
+        by_player.setdefault(duel.p2.id, set()).add(idx)
+
+    assigned = [0] * len(duels)
+    queries: list[tuple[int, int, int]] = []
+    left = set(range(len(duels)))
+    while left:
+        player = max(by_player, key=lambda p: len(by_player[p] & left))
+        covered = by_player.pop(player) & left
+        left -= covered
+
+        merged: list[list[int]] = []
+        for start, end in sorted(windows[idx] for idx in covered):
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        queries.extend((player, start, end) for start, end in merged)
+        for idx in covered:
+            assigned[idx] = player
+
+    return assigned, queries
+
+
+def _duel_history(
+    duel: Duel, player_id: int, history: dict[str, Table], days: int
+) -> list[Table]:
+    """Return tables of a duel found in the history of one of its players.
+
+    BGA gives elo_win for the player whose history was fetched,
+    it is turned into the one of the first player of the duel.
+    """
+    start_date, end_date = _window(duel, days)
+    players = {str(duel.p1.id), str(duel.p2.id)}
+
+    tables: list[Table] = []
+    for table in history.values():
+        if set(str(table["players"]).split(",")) != players:
+            continue
+        if not start_date <= int(table["start"]) <= end_date:
+            continue
+        if player_id != duel.p1.id:
+            table = {**table, "elo_win": -int(table.get("elo_win", 0) or 0)}
+        tables.append(table)
+
+    return tables
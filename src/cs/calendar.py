@@ -1,7 +1,7 @@
 """Module for Carcassonne Spain Calendar class."""
 
 from datetime import datetime, timedelta, timezone
-from typing import Dict, List, TypedDict
+from typing import Dict, Iterator, List, TypedDict
 
 from cachetools.func import ttl_cache
 
@@ -56,3 +56,9 @@ class Calendar:
     def duels(self, duel_round: int) -> List[DuelInfo]:
         """Return duels for a given round."""
         return self._calendar[duel_round]["duels"]
+
+    def entries(self) -> Iterator[tuple[int, datetime, Player, Player]]:
+        """Yield round, start and players of every duel, in insertion order."""
+        for duel_round, data in self._calendar.items():
+            for duel in data["duels"]:
+                yield duel_round, data["start"], duel["player_1"], duel["player_2"]
@@ -1,39 +1,94 @@
 """Date handling utils."""
 
-from datetime import datetime
+from datetime import date, datetime
+from functools import cache
+from typing import Iterable, Iterator, Optional
 from zoneinfo import ZoneInfo
 
 from src.settings import config
 
 TIMEZONE = config.get("timezone", "Europe/Madrid")
 
+# Formats found in the sheets, in the order they are tried
+FORMATS = (
+    "%d/%m/%Y %H:%M:%S",
+    "%d/%m/%Y %H:%M",
+    "%Y-%m-%d %H:%M:%S",
+    "%d/%m/%Y",
+)
+
+
+@cache
+def zone(timezone: str) -> ZoneInfo:
+    """Return tz object for a timezone name."""
+    return ZoneInfo(timezone)
+
+
+# pylint: disable=too-few-public-methods
+class DateColumn:
+    """Parse the dates of a sheet column.
+
+    The format is detected with the first value and reused for the
+    rest of the column. Other formats are only tried on a mismatch.
+    """
+
+    def __init__(self, timezone: str = TIMEZONE):
+        """Build a parser for dates in the given timezone."""
+        self.tz = zone(timezone)
+        self.date_format: Optional[str] = None
+
+    def parse(self, date_str: str) -> datetime:
+        """Parse a date string and return a UTC date."""
+        if self.date_format:
+            try:
+                return self._utc(datetime.strptime(date_str, self.date_format))
+            except ValueError:
+                pass
+
+        for date_format in FORMATS:
+            if date_format == self.date_format:
+                continue
 
-def utc_datetime(date_str: str, timezone: str = TIMEZONE) -> datetime:
-    """Parse a date string and return a UTC date."""
-    try:
-        my_date = datetime.strptime(date_str, "%d/%m/%Y %H:%M:%S")
-    except ValueError:
-        try:
-            my_date = datetime.strptime(date_str, "%d/%m/%Y %H:%M")
-        except ValueError:
             try:
-                my_date = datetime.strptime(date_str, "%Y-%m-%d %H:%M:%S")
+                my_date = datetime.strptime(date_str, date_format)
             except ValueError:
-                my_date = datetime.strptime(date_str, "%d/%m/%Y")
+                continue
+
+            self.date_format = date_format
+            return self._utc(my_date)
+
+        raise ValueError(f"Unknown date format '{date_str}'")
 
-    my_date_with_tz = my_date.replace(tzinfo=ZoneInfo(timezone))
-    my_date_in_utc = my_date_with_tz.astimezone(ZoneInfo("UTC"))
-    return my_date_in_utc
+    def _utc(self, my_date: datetime) -> datetime:
+        """Set timezone of a naive date and convert it to UTC."""
+        return my_date.replace(tzinfo=self.tz).astimezone(zone("UTC"))
+
+
+def parse_column(values: Iterable[str], timezone: str = TIMEZONE) -> Iterator[datetime]:
+    """Parse the dates of a column and yield them in UTC."""
+    column = DateColumn(timezone)
+    for value in values:
+        yield column.parse(value)
+
+
+def utc_datetime(date_str: str, timezone: str = TIMEZONE) -> datetime:
+    """Parse a date string and return a UTC date."""
+    return DateColumn(timezone).parse(date_str)
 
 
 def format_time(my_date: datetime, timezone: str = TIMEZONE) -> str:
     """Format a datetime and return time in nice format."""
-    my_date_with_tz = my_date.astimezone(ZoneInfo(timezone))
+    my_date_with_tz = my_date.astimezone(zone(timezone))
     return my_date_with_tz.time().strftime("%H:%M")
 
 
 def date_timestamp(my_datetime: datetime, timezone: str = TIMEZONE) -> int:
     """Return timestamp for the date part of a datetime."""
-    my_datetime_with_tz = my_datetime.astimezone(ZoneInfo(timezone))
+    my_datetime_with_tz = my_datetime.astimezone(zone(timezone))
     my_date = my_datetime_with_tz.replace(hour=0, minute=0, second=0, microsecond=0)
     return int(my_date.timestamp())
+
+
+def local_date(my_datetime: datetime, timezone: str = TIMEZONE) -> date:
+    """Return the date of a datetime in the league timezone."""
+    return my_datetime.astimezone(zone(timezone)).date()
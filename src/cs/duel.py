@@ -15,6 +15,19 @@ class Duel:
     A duel consists of several games between two players.
     """
 
+    __slots__ = (
+        "p1",
+        "p2",
+        "planned",
+        "schedule_timestamp",
+        "outcome_timestamp",
+        "p1_score",
+        "p2_score",
+        "played",
+        "played_for_real",
+        "_url",
+    )
+
     # pylint: disable=too-many-arguments
     # pylint: disable=too-many-positional-arguments
     def __init__(
@@ -53,7 +66,7 @@ class Duel:
         self.p2_score = p2_score
         self.played = played
         self.played_for_real = played_for_real
-        self._url = None
+        self._url: Optional[str] = None
 
     # pylint: enable=too-many-positional-arguments
     # pylint: enable=too-many-arguments
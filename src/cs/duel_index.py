@@ -0,0 +1,90 @@
+"""Module for Carcassonne Spain DuelIndex class."""
+
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime
+from typing import Callable, Optional, Sequence
+
+from src.cs.date import local_date
+from src.cs.duel import Duel
+
+DAY_SHIFT = 32  # Bits left for the planned timestamp within a date key
+
+
+class DuelIndex:
+    """Positions of duels sorted by local date, queried by date range.
+
+    Within a date duels are ordered by their planned datetime.
+    The index only keeps positions, duels are fetched from the
+    sequence indexed when queried.
+    """
+
+    def __init__(
+        self,
+        duels: Sequence[Duel],
+        key: Callable[[Duel], Optional[datetime]],
+    ):
+        """Build the index.
+
+        Parameters
+        ----------
+            duels Duels to index.
+            key Datetime used to place each duel in a date,
+                duels without it are left out.
+        """
+        self._source = duels
+        self._key = key
+        self._keys = array("q")
+        self._positions = array("q")
+        self.add(0)
+
+    def add(self, start: int):
+        """Index duels in the sequence from position start on."""
+        entries: list[tuple[int, int]] = []
+        for position in range(start, len(self._source)):
+            duel = self._source[position]
+            when = self._key(duel)
+            if when is not None:
+                entries.append((_sort_key(local_date(when), duel.planned), position))
+
+        if not self._keys:
+            entries.sort(key=lambda entry: entry[0])
+            self._keys.extend(entry[0] for entry in entries)
+            self._positions.extend(entry[1] for entry in entries)
+            return
+
+        for sort_key, position in entries:
+            pos = bisect_right(self._keys, sort_key)
+            self._keys.insert(pos, sort_key)
+            self._positions.insert(pos, position)
+
+    def extended(self, duels: Sequence[Duel]) -> "DuelIndex":
+        """Return a new index of duels, which start with the ones indexed here.
+
+        Positions already indexed are copied, only duels after them are
+        indexed, and this index is left untouched for its readers.
+        """
+        # pylint: disable=protected-access
+        index = DuelIndex([], self._key)
+        index._source = duels
+        index._keys = array("q", self._keys)
+        index._positions = array("q", self._positions)
+        # pylint: enable=protected-access
+        index.add(len(self._source))
+
+        return index
+
+    def between(self, start: date, end: date) -> list[Duel]:
+        """Return ordered duels from start to end, both included."""
+        lo = bisect_left(self._keys, start.toordinal() << DAY_SHIFT)
+        hi = bisect_left(self._keys, (end.toordinal() + 1) << DAY_SHIFT)
+        return [self._source[position] for position in self._positions[lo:hi]]
+
+    def __len__(self) -> int:
+        """Return number of duels in the index."""
+        return len(self._positions)
+
+
+def _sort_key(day: date, planned: datetime) -> int:
+    """Sortable integer for a date and planned datetime."""
+    return (day.toordinal() << DAY_SHIFT) + int(planned.timestamp())
@@ -0,0 +1,199 @@
+"""Module for Carcassonne Spain DuelTable class."""
+
+import math
+from array import array
+from datetime import datetime
+from typing import Iterable, MutableSequence, overload
+
+from src.cs.date import zone
+from src.cs.duel import Duel
+from src.cs.player import Player
+
+NO_SCORE = -1
+PLAYED = 1
+PLAYED_FOR_REAL = 2
+
+Row = tuple[tuple[int, ...], tuple[float, ...]]
+
+
+# pylint: disable=too-many-instance-attributes
+class DuelTable(MutableSequence[Duel]):
+    """Duels stored as column arrays.
+
+    Takes a fraction of the memory of a list of Duel objects.
+    Duels are built when accessed, so they are views of the table:
+    changing one does not change the table.
+    """
+
+    def __init__(self, duels: Iterable[Duel] = ()):
+        """Build a table holding duels."""
+        self._players: dict[int, Player] = {}
+        self._p1 = array("q")
+        self._p2 = array("q")
+        self._planned = array("d")
+        self._scheduled = array("d")
+        self._played = array("d")
+        self._p1_score = array("h")
+        self._p2_score = array("h")
+        self._flags = array("B")
+        self.extend(duels)
+
+    def _columns(self) -> tuple[tuple["array[int]", ...], tuple["array[float]", ...]]:
+        """Return integer and float columns."""
+        return (
+            (self._p1, self._p2, self._p1_score, self._p2_score, self._flags),
+            (self._planned, self._scheduled, self._played),
+        )
+
+    def _row(self, duel: Duel) -> Row:
+        """Return integer and float column values for a duel."""
+        self._players.setdefault(duel.p1.id, duel.p1)
+        self._players.setdefault(duel.p2.id, duel.p2)
+        outcome = duel.outcome_timestamp
+        flags = (PLAYED if duel.played else 0) | (
+            PLAYED_FOR_REAL if duel.played_for_real else 0
+        )
+
+        return (
+            (
+                duel.p1.id,
+                duel.p2.id,
+                NO_SCORE if duel.p1_score is None else duel.p1_score,
+                NO_SCORE if duel.p2_score is None else duel.p2_score,
+                flags,
+            ),
+            (
+                duel.planned.timestamp(),
+                duel.schedule_timestamp.timestamp(),
+                outcome.timestamp() if outcome else math.nan,
+            ),
+        )
+
+    def _duel(self, index: int) -> Duel:
+        """Build the duel stored at a position."""
+        played = self._played[index]
+        p1_score = self._p1_score[index]
+        p2_score = self._p2_score[index]
+        flags = self._flags[index]
+
+        return Duel(
+            p1=self._players[self._p1[index]],
+            p2=self._players[self._p2[index]],
+            planned=_datetime(self._planned[index]),
+            schedule_timestamp=_datetime(self._scheduled[index]),
+            outcome_timestamp=None if math.isnan(played) else _datetime(played),
+            p1_score=None if p1_score == NO_SCORE else p1_score,
+            p2_score=None if p2_score == NO_SCORE else p2_score,
+            played=bool(flags & PLAYED),
+            played_for_real=bool(flags & PLAYED_FOR_REAL),
+        )
+
+    @overload
+    def __getitem__(self, index: int) -> Duel:
+        """Return duel at index."""
+
+    @overload
+    def __getitem__(self, index: slice) -> list[Duel]:
+        """Return list of duels at index."""
+
+    def __getitem__(self, index: int | slice) -> Duel | list[Duel]:
+        """Return duel, or list of duels, at index."""
+        if isinstance(index, slice):
+            return [self._duel(i) for i in range(*index.indices(len(self)))]
+
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("DuelTable index out of range")
+
+        return self._duel(index)
+
+    @overload
+    def __setitem__(self, index: int, value: Duel) -> None:
+        """Replace duel at index."""
+
+    @overload
+    def __setitem__(self, index: slice, value: Iterable[Duel]) -> None:
+        """Replace duels at index."""
+
+    def __setitem__(self, index: int | slice, value: Duel | Iterable[Duel]):
+        """Replace duel at index."""
+        if isinstance(index, slice) or not isinstance(value, Duel):
+            raise TypeError("DuelTable only supports replacing single duels")
+
+        ints, floats = self._row(value)
+        int_columns, float_columns = self._columns()
+        for column, item in zip(int_columns, ints):
+            column[index] = item
+        for column, item in zip(float_columns, floats):
+            column[index] = item
+
+    def __delitem__(self, index: int | slice):
+        """Remove duel, or duels, at index."""
+        for columns in self._columns():
+            for column in columns:
+                del column[index]
+
+    def insert(self, index: int, value: Duel):
+        """Insert duel before index."""
+        ints, floats = self._row(value)
+        int_columns, float_columns = self._columns()
+        for column, item in zip(int_columns, ints):
+            column.insert(index, item)
+        for column, item in zip(float_columns, floats):
+            column.insert(index, item)
+
+    def append(self, value: Duel):
+        """Add duel at the end."""
+        ints, floats = self._row(value)
+        int_columns, float_columns = self._columns()
+        for column, item in zip(int_columns, ints):
+            column.append(item)
+        for column, item in zip(float_columns, floats):
+            column.append(item)
+
+    def __len__(self) -> int:
+        """Return number of duels."""
+        return len(self._flags)
+
+    def head(self, length: int) -> "DuelTable":
+        """Return a new table holding the first length duels."""
+        # pylint: disable=protected-access
+        table = DuelTable()
+        table._players = dict(self._players)
+        int_columns, float_columns = self._columns()
+        int_copies, float_copies = table._columns()
+        # pylint: enable=protected-access
+        for column, copy in zip(int_columns, int_copies):
+            copy.extend(column[:length])
+        for column, copy in zip(float_columns, float_copies):
+            copy.extend(column[:length])
+
+        return table
+
+
+# pylint: enable=too-many-instance-attributes
+
+
+def _datetime(timestamp: float) -> datetime:
+    """Return UTC datetime for a timestamp."""
+    return datetime.fromtimestamp(timestamp, zone("UTC"))
+
+
+def truncated(duels: MutableSequence[Duel], length: int) -> MutableSequence[Duel]:
+    """Return a copy of the first length duels, in the same kind of sequence.
+
+    Duels in a list are shared with the copy, not copied.
+    """
+    if isinstance(duels, DuelTable):
+        return duels.head(length)
+
+    return list(duels[:length])
+
+
+def compact(duels: Iterable[Duel], enabled: bool) -> MutableSequence[Duel]:
+    """Return duels in a DuelTable if enabled, in a list otherwise."""
+    if enabled:
+        return DuelTable(duels)
+
+    return list(duels)
@@ -1,22 +1,65 @@
 """Module for Carcassonne Spain Group class."""
 
-import csv
+import itertools
+import sqlite3
+import threading
 import time
-from datetime import date
-from urllib import request
+from collections import deque
+from datetime import date, timedelta
+from typing import (
+    Any,
+    Callable,
+    Iterable,
+    Iterator,
+    MutableSequence,
+    Optional,
+    Sequence,
+    TypeVar,
+)
 
-from cachetools.func import ttl_cache
-
-from src.bga import BGA
 from src.cs.calendar import Calendar
-from src.cs.date import utc_datetime
+from src.cs.date import DateColumn
 from src.cs.duel import Duel
+from src.cs.duel_index import DuelIndex
+from src.cs.duel_table import compact, truncated
 from src.cs.player import Player
+from src.cs.row_log import RowLog
 from src.settings import config, logger
+from src.sheets import Sheets
+from src.store import Store, league_store
 
 CACHE_TTL = 3600  # in seconds
-
-
+RETRY_TTL = 300  # in seconds, stale data is served before revalidating again
+# Sheet name in config -> property built from it, in dependency order
+SHEETS = {
+    "players": "players",
+    "calendar": "calendar",
+    "schedule": "schedule",
+    "results": "outcome",
+}
+_MISSING = object()
+# Attributes holding built data, swapped in all at once by a refresh
+_STATE = (
+    "_cache",
+    "_expires",
+    "_built",
+    "_version",
+    "_players_by_name",
+    "_scheduled_by_pair",
+    "_schedule_by_date",
+    "_outcome",
+    "_outcome_by_date",
+    "_outcome_log",
+    "_outcome_players",
+    "_outcome_scheduled",
+)
+# Data versions, never repeated, even across groups
+_VERSIONS = itertools.count(1)
+
+T = TypeVar("T")
+
+
+# pylint: disable=too-many-instance-attributes
 class Group:
     """Represent a group.
 
@@ -26,10 +69,275 @@ class Group:
     some already played, some that will be played in the future.
     """
 
-    def __init__(self, name: str, cnf: dict[str, str]):
-        """Build a group."""
+    def __init__(self, name: str, cnf: dict[str, str], season: Optional[int] = None):
+        """Build a group.
+
+        Groups built with a season are saved to, and can be loaded from,
+        the store when it is enabled.
+        """
         self.name = name
         self.config = cnf
+        self.season = season
+        self.compact = bool(config.get("compact_duels", False))
+        self._store = league_store() if season is not None else None
+        self._revalidating = False
+        self._lock = threading.Lock()
+        # Data built from each sheet, and when it expires, keyed by sheet name
+        self._cache: dict[str, Any] = {}
+        self._expires: dict[str, float] = {}
+        self._cache_lock = threading.RLock()
+        self._version = 0
+        self._built: set[str] = set()  # Sheets built since last invalidated
+        # Indexes rebuilt along with players and schedule on every refresh
+        self._players_by_name: dict[str, Player] = {}
+        self._scheduled_by_pair: dict[tuple[int, int], int] = {}
+        self._schedule_by_date = DuelIndex([], lambda duel: duel.planned)
+        # Outcome is refreshed incrementally, along with what its duels depend on
+        self._outcome: MutableSequence[Duel] = compact([], self.compact)
+        self._outcome_by_date = DuelIndex(
+            self._outcome, lambda duel: duel.outcome_timestamp
+        )
+        self._outcome_log = RowLog()
+        self._outcome_players: list[Player] = []
+        # Hash of planned and schedule timestamps each result was matched to
+        self._outcome_scheduled: dict[tuple[int, int], Optional[int]] = {}
+        # Saves to the store held back, while building a staged refresh
+        self._saves: Optional[list[tuple[str, Callable[[Store, int], None]]]] = None
+
+    @property
+    def sheets(self) -> list[str]:
+        """Names of the sheets configured for this group."""
+        return [sheet for sheet in SHEETS if self.config.get(sheet)]
+
+    def fetch(self, sheet: str) -> float:
+        """Download a sheet so it is ready for the next refresh.
+
+        Only the sheets cache on disk is refreshed, rows are dropped as
+        they are read, and the refresh streams them again from there.
+        Safe to call from worker threads. Returns seconds spent fetching.
+        """
+        start = time.perf_counter()
+        deque(self._read_csv(self.config[sheet]), maxlen=0)
+
+        return time.perf_counter() - start
+
+    def warm(self):
+        """Build players, calendar, schedule and outcome into their caches."""
+        for sheet in self.sheets:
+            try:
+                getattr(self, SHEETS[sheet])
+            except (LookupError, ValueError, KeyError) as e:
+                logger.warning("Could not warm %s for %s group: %s", sheet, self, e)
+
+    # pylint: disable=protected-access
+    def refresh(self) -> bool:
+        """Rebuild cached data, from fetched sheets when still fresh.
+
+        Data is built apart and swapped in once all of it is built, so
+        readers keep the data they had while it is built, and after it
+        if any sheet fails to build. Returns False if it failed.
+        """
+        staged = self._staged()
+        try:
+            for sheet in self.sheets:
+                getattr(staged, SHEETS[sheet])
+        except (OSError, LookupError, ValueError, KeyError) as e:
+            logger.warning("Could not refresh %s group: %s", self, e)
+            return False
+
+        with self._cache_lock:
+            for name in _STATE:
+                setattr(self, name, getattr(staged, name))
+        for sheet, save in staged._saves or ():
+            self._save(sheet, save)
+
+        return True
+
+    def _staged(self) -> "Group":
+        """Return an empty group to build data into, carrying on the outcome.
+
+        Its saves to the store are held back, to be made once it is swapped in.
+        """
+        staged = Group(self.name, self.config, self.season)
+        staged.compact, staged._store, staged._saves = self.compact, self._store, []
+        with self._cache_lock:
+            staged._outcome = self._outcome
+            staged._outcome_by_date = self._outcome_by_date
+            staged._outcome_log = self._outcome_log.copy()
+            staged._outcome_players = self._outcome_players
+            staged._outcome_scheduled = dict(self._outcome_scheduled)
+
+        return staged
+
+    # pylint: enable=protected-access
+
+    @property
+    def version(self) -> Optional[int]:
+        """Version of the cached data, None if none was built.
+
+        It changes every time data is built or loaded, so anything
+        derived from the group is current while the version is the same.
+        Checking it does not build any data.
+        """
+        with self._cache_lock:
+            if not self._built:
+                return None
+            return self._version
+
+    def revalidate(self) -> bool:
+        """Fetch sheets again and rebuild data from them.
+
+        Data is served as it is while sheets are downloaded, readers
+        only wait for the rebuild. Revalidations of a group are never
+        run twice at once: returns False if one was already running.
+        """
+        with self._lock:
+            if self._revalidating:
+                return False
+            self._revalidating = True
+
+        self._revalidate()
+        return True
+
+    def expires_in(self) -> float:
+        """Seconds until data built for the group expires, inf if none built."""
+        with self._cache_lock:
+            if not self._expires:
+                return float("inf")
+            return min(self._expires.values()) - time.monotonic()
+
+    def _revalidate(self):
+        """Fetch sheets and rebuild data, unless fetching any of them fails.
+
+        On failure, data is served as it is for RETRY_TTL seconds more,
+        instead of every read trying again.
+        """
+        try:
+            for sheet in self.sheets:
+                try:
+                    self.fetch(sheet)
+                except (OSError, ValueError) as e:
+                    logger.warning("Could not revalidate %s for %s: %s", sheet, self, e)
+                    self._postpone()
+                    return
+
+            if self.refresh():
+                logger.info("Revalidated %s group", self)
+            else:
+                self._postpone()
+        finally:
+            with self._lock:
+                self._revalidating = False
+
+    def _postpone(self):
+        """Keep data built for the group from expiring in RETRY_TTL seconds."""
+        with self._cache_lock:
+            retry = time.monotonic() + RETRY_TTL
+            for sheet, expires in self._expires.items():
+                self._expires[sheet] = max(expires, retry)
+
+    def _revalidate_async(self):
+        """Revalidate in a background thread, if not being revalidated yet."""
+        with self._lock:
+            if self._revalidating:
+                return
+            self._revalidating = True
+
+        threading.Thread(
+            target=self._revalidate, name=f"revalidate-{self}", daemon=True
+        ).start()
+
+    def invalidate(self):
+        """Drop cached data so it is built again on next use."""
+        with self._cache_lock:
+            self._cache.clear()
+            self._expires.clear()
+            self._built.clear()
+
+    def load(self, max_age: float) -> bool:
+        """Fill caches with the data kept in the store.
+
+        Parameters
+        ----------
+        max_age: Seconds since the last sync for stored data to be used.
+
+        Returns
+        -------
+        True if every sheet of the group was found in the store
+        and synced recently enough. Caches are left alone otherwise.
+        """
+        if self._store is None or self.season is None:
+            return False
+
+        store, season = self._store, self.season
+        sheets = self.sheets
+        try:
+            synced = store.synced(season, self.name)
+            if any(synced.get(sheet, 0) < time.time() - max_age for sheet in sheets):
+                return False
+
+            players = store.load_players(season, self.name)
+            calendar = None
+            if "calendar" in sheets:
+                calendar = store.load_calendar(season, self.name, players)
+            schedule = store.load_duels(season, self.name, "schedule", players)
+            outcome = store.load_duels(season, self.name, "results", players)
+        except (sqlite3.Error, KeyError) as e:
+            logger.warning("Could not load %s group from store: %s", self, e)
+            return False
+
+        with self._cache_lock:
+            self._cache["players"] = self._index_players(players)
+            self._cache["calendar"] = calendar
+            self._cache["schedule"] = self._index_schedule(
+                compact(schedule, self.compact)
+            )
+            self._cache["results"] = self._reset_outcome(outcome, players)
+            expires = time.monotonic() + CACHE_TTL
+            self._expires = {sheet: expires for sheet in SHEETS}
+            self._built.update(SHEETS)
+            self._version = next(_VERSIONS)
+        logger.info("Loaded %s group from store", self)
+
+        return True
+
+    def _cached(self, sheet: str, build: Callable[[], T]) -> T:
+        """Return what build makes from a sheet, cached for CACHE_TTL seconds.
+
+        Builds are serialized per group, so threads asking for data
+        being built wait for it instead of building it again.
+
+        Expired data is still returned, while the group is revalidated
+        in the background, so readers never wait for a download of data
+        they already had.
+        """
+        with self._cache_lock:
+            value = self._cache.get(sheet, _MISSING)
+            if value is _MISSING:
+                value = self._cache[sheet] = build()
+                self._expires[sheet] = time.monotonic() + CACHE_TTL
+                self._built.add(sheet)
+                self._version = next(_VERSIONS)
+            elif time.monotonic() >= self._expires[sheet]:
+                self._revalidate_async()
+            return value
+
+    def _save(self, sheet: str, save: Callable[[Store, int], None]):
+        """Save data built from a sheet in the store, if enabled."""
+        if self._store is None or self.season is None:
+            return
+        if self._saves is not None:
+            self._saves.append((sheet, save))
+            return
+
+        try:
+            save(self._store, self.season)
+        except sqlite3.Error as e:
+            logger.warning("Could not save %s for %s group: %s", sheet, self, e)
+
+    def _rows(self, sheet: str) -> Iterable[dict[str, str]]:
+        """Return rows for a sheet, streamed one at a time."""
+        return self._read_csv(self.config[sheet])
 
     @property
     def gcalendar_color(self) -> int:
@@ -37,24 +345,26 @@ class Group:
         return int(self.config.get("gcalendar_color", "8"))
 
     @property
-    @ttl_cache(ttl=CACHE_TTL)
     def calendar(self) -> Calendar | None:
         """Return calendar for this group."""
+        return self._cached("calendar", self._build_calendar)
+
+    def _build_calendar(self) -> Calendar | None:
         logger.info("Fetching calendar for %s group", self)
-        url = self.config.get("calendar", "")
 
-        if not url:
+        if not self.config.get("calendar", ""):
             logger.info("No calendar found")
             return None
 
         calendar = Calendar()
-        for row in self._read_csv(url):
+        dates = DateColumn()
+        for row in self._rows("calendar"):
             if not row["player1"] or not row["player2"]:
                 continue
             if row["player1"].strip() == "" or row["player2"].strip() == "":
                 continue
 
-            start = utc_datetime(row["date"])
+            start = dates.parse(row["date"])
             player_1 = self._find_player(row["player1"])
             player_2 = self._find_player(row["player2"])
             duel_round = int(row["round"])
@@ -62,100 +372,207 @@ class Group:
             calendar.add(
                 player_1=player_1, player_2=player_2, duel_round=duel_round, start=start
             )
+        self._save(
+            "calendar",
+            lambda store, season: store.save_calendar(season, self.name, calendar),
+        )
 
         return calendar
 
     @property
-    @ttl_cache(ttl=CACHE_TTL)
     def players(self) -> list[Player]:
         """List of players within the group."""
+        return self._cached("players", self._build_players)
+
+    def _build_players(self) -> list[Player]:
         logger.info("Fetching players for %s group", self)
 
-        url = self.config["players"]
-        return [
+        players = [
             Player(int(row["id"]), row["name"], row.get("telegram", ""))
-            for row in self._read_csv(url)
+            for row in self._rows("players")
         ]
+        self._save(
+            "players",
+            lambda store, season: store.save_players(season, self.name, players),
+        )
+
+        return self._index_players(players)
+
+    def _index_players(self, players: list[Player]) -> list[Player]:
+        """Index players by name."""
+        players_by_name: dict[str, Player] = {}
+        for player in players:
+            players_by_name.setdefault(player.name.casefold(), player)
+        self._players_by_name = players_by_name
+
+        return players
 
     def _find_player(self, name: str) -> Player:
         """Find a player given its name."""
-        for player in self.players:
-            if player.name.lower() == name.lower():
-                return player
-
-        raise LookupError(f"Player '{name}' not found in group {self}")
+        _ = self.players  # Build players, and their index, if needed
+        try:
+            return self._players_by_name[name.casefold()]
+        except KeyError:
+            raise LookupError(f"Player '{name}' not found in group {self}") from None
 
     def _find_scheduled_duel(self, p1: Player, p2: Player) -> Duel:
-        for duel in self.schedule:
-            if p1 == duel.p1 and p2 == duel.p2:
-                return duel
-
-        raise LookupError(f"Duel for {p1} and {p2} not found")
+        schedule = self.schedule  # Build schedule, and its index, if needed
+        try:
+            return schedule[self._scheduled_by_pair[(p1.id, p2.id)]]
+        except KeyError:
+            raise LookupError(f"Duel for {p1} and {p2} not found") from None
 
     @property
-    @ttl_cache(ttl=CACHE_TTL)
-    def schedule(self) -> list[Duel]:
+    def schedule(self) -> Sequence[Duel]:
         """Duels scheduled for the group."""
+        return self._cached("schedule", self._build_schedule)
+
+    def _build_schedule(self) -> Sequence[Duel]:
         logger.info("Fetching schedule for %s group", self)
+        schedule = compact(self._scheduled_duels(self._rows("schedule")), self.compact)
+        self._save(
+            "schedule",
+            lambda store, season: store.save_duels(
+                season, self.name, "schedule", schedule
+            ),
+        )
+
+        return self._index_schedule(schedule)
+
+    def _index_schedule(self, schedule: Sequence[Duel]) -> Sequence[Duel]:
+        """Index scheduled duels by players and by date."""
+        scheduled_by_pair: dict[tuple[int, int], int] = {}
+        for position, duel in enumerate(schedule):
+            scheduled_by_pair.setdefault((duel.p1.id, duel.p2.id), position)
+        self._scheduled_by_pair = scheduled_by_pair
+        self._schedule_by_date = DuelIndex(schedule, lambda duel: duel.planned)
 
-        schedule: list[Duel] = []
-        url = self.config["schedule"]
-        for row in self._read_csv(url):
+        return schedule
+
+    def _scheduled_duels(self, rows: Iterable[dict[str, str]]) -> Iterator[Duel]:
+        """Build scheduled duels one row at a time."""
+        timestamps = DateColumn()
+        planned_dates = DateColumn()
+        for row in rows:
             player_1 = self._find_player(row["player1"])
             player_2 = self._find_player(row["player2"])
-            timestamp = utc_datetime(row["timestamp"])
-            planned = utc_datetime(f'{row["date"]} {row["time"]}')
-
-            schedule.append(
-                Duel(
-                    p1=player_1,
-                    p2=player_2,
-                    planned=planned,
-                    schedule_timestamp=timestamp,
-                )
+            timestamp = timestamps.parse(row["timestamp"])
+            planned = planned_dates.parse(f'{row["date"]} {row["time"]}')
+
+            yield Duel(
+                p1=player_1,
+                p2=player_2,
+                planned=planned,
+                schedule_timestamp=timestamp,
             )
 
-        return schedule
-
     @property
-    @ttl_cache(ttl=CACHE_TTL)
-    def outcome(self) -> list[Duel]:
-        """Duels already played within group."""
+    def outcome(self) -> Sequence[Duel]:
+        """Duels already played within group.
+
+        The results sheet only grows, so a refresh parses just the rows
+        added since the previous one and appends their duels. Duels already
+        built are kept, unless a row was edited or the players or schedule
+        they were built from changed, then duels are rebuilt from that row on.
+        """
+        return self._cached("results", self._build_outcome)
+
+    def _build_outcome(self) -> Sequence[Duel]:
         logger.info("Fetching outcome for %s group", self)
+        if not self._outcome_is_current():
+            self._outcome_log.clear()
+            self._outcome_scheduled = {}
+        self._outcome_players = self.players
+
+        previous = len(self._outcome)
+        new = list(self._played_duels(self._outcome_log.diff(self._rows("results"))))
+        kept = self._outcome_log.kept
+
+        # Readers may be using the outcome and its index, without the lock,
+        # so new ones are built, reusing duels kept, and swapped in
+        outcome = truncated(self._outcome, kept)
+        outcome.extend(new)
+        if kept == previous:
+            by_date = self._outcome_by_date.extended(outcome)
+        else:
+            by_date = DuelIndex(outcome, lambda duel: duel.outcome_timestamp)
+        self._outcome, self._outcome_by_date = outcome, by_date
 
-        outcome: list[Duel] = []
-        url = self.config["results"]
+        logger.info("Parsed %d of %d results for %s", len(new), len(outcome), self)
+        self._save(
+            "results",
+            lambda store, season: store.save_duels(
+                season, self.name, "results", outcome, kept
+            ),
+        )
 
-        for row in self._read_csv(url):
+        return outcome
+
+    def _reset_outcome(
+        self, duels: Iterable[Duel], players: list[Player]
+    ) -> Sequence[Duel]:
+        """Replace outcome with duels built elsewhere.
+
+        Results are parsed again from the first row on next refresh.
+        """
+        outcome = compact(duels, self.compact)
+        self._outcome, self._outcome_by_date = outcome, DuelIndex(
+            outcome, lambda duel: duel.outcome_timestamp
+        )
+        self._outcome_log.clear()
+        self._outcome_players = players
+        self._outcome_scheduled = {}
+
+        return self._outcome
+
+    def _outcome_is_current(self) -> bool:
+        """Check players and schedule used to build outcome did not change."""
+        players = self.players
+        if players is not self._outcome_players and players != self._outcome_players:
+            return False
+
+        schedule = self.schedule  # Build schedule, and its index, if needed
+        for pair, scheduled in self._outcome_scheduled.items():
+            position = self._scheduled_by_pair.get(pair)
+            duel = None if position is None else schedule[position]
+            current = hash((duel.planned, duel.schedule_timestamp)) if duel else None
+            if scheduled != current:
+                return False
+
+        return True
+
+    def _played_duels(self, rows: Iterable[dict[str, str]]) -> Iterator[Duel]:
+        """Build played duels one row at a time."""
+        timestamps = DateColumn()
+        for row in rows:
             player_1 = self._find_player(row["player1"])
             player_2 = self._find_player(row["player2"])
-            odate = utc_datetime(row["timestamp"])
+            odate = timestamps.parse(row["timestamp"])
             played = not row.get("not played", False)
 
             try:
                 pduel = self._find_scheduled_duel(player_1, player_2)
                 pdate = pduel.planned
                 sdate = pduel.schedule_timestamp
+                scheduled = hash((pdate, sdate))
             except LookupError:
                 pdate = odate
                 sdate = odate
-
-            outcome.append(
-                Duel(
-                    p1=player_1,
-                    p2=player_2,
-                    planned=pdate,
-                    schedule_timestamp=sdate,
-                    outcome_timestamp=odate,
-                    p1_score=int(row["score1"]),
-                    p2_score=int(row["score2"]),
-                    played=True,
-                    played_for_real=played,
-                )
+                scheduled = None
+            self._outcome_scheduled[(player_1.id, player_2.id)] = scheduled
+
+            yield Duel(
+                p1=player_1,
+                p2=player_2,
+                planned=pdate,
+                schedule_timestamp=sdate,
+                outcome_timestamp=odate,
+                p1_score=int(row["score1"]),
+                p2_score=int(row["score2"]),
+                played=True,
+                played_for_real=played,
             )
 
-        return outcome
-
     def unschedule(self) -> list[list[Player]]:
         """Return unscheduled duels."""
         unscheduled: list[list[Player]] = []
@@ -180,43 +597,49 @@ class Group:
         If query date is in the future, it will return scheduled duels.
         If query date is in the past, it will return already played duels.
         """
-        if force_schedule or query_date >= date.today():
-            all_duels = self.schedule
-            duels = filter(lambda m: m.planned.date() == query_date, all_duels)
-        else:
-            all_duels = self.outcome
-            duels = filter(
-                lambda m: m.outcome_timestamp
-                and m.outcome_timestamp.date() == query_date,
-                all_duels,
-            )
+        return self.duels_between(query_date, query_date, force_schedule)
 
-        return sorted(list(duels), key=lambda m: m.planned)
+    def duels_between(
+        self, start: date, end: date, force_schedule: bool = False
+    ) -> list[Duel]:
+        """Return ordered duels from start to end, both included.
 
-    def wrong_outcome(self, query_date: date) -> list[Duel]:
-        """Return duels with outcome that need to be checked."""
-        bga = BGA()
-        wrong_duels: list[Duel] = []
-        for duel in self.duels(query_date):
-            if not bga.check_duel(duel):
-                wrong_duels.append(duel)
-            time.sleep(config["bga"]["interval"])
+        Days from today on return scheduled duels,
+        days in the past return already played duels.
+        Dates are taken in the league timezone.
+        """
+        today = date.today()
+        if force_schedule or start >= today:
+            _ = self.schedule  # Build schedule, and its index, if needed
+            return self._schedule_by_date.between(start, end)
+
+        _ = self.outcome  # Build outcome, and its index, if needed
+        duels = self._outcome_by_date.between(start, min(end, today - timedelta(1)))
+        if end >= today:
+            _ = self.schedule
+            duels += self._schedule_by_date.between(today, end)
+
+        return duels
+
+    def wrong_outcome(self, query_date: date, recheck: bool = False) -> list[Duel]:
+        """Return duels with outcome that need to be checked.
 
-        return wrong_duels
+        Duels already found right are skipped, unless recheck.
+        """
+        from src.bga import BGA  # pylint: disable=import-outside-toplevel
+
+        duels = self.duels(query_date)
+        checks = BGA().check_duels(duels, recheck=recheck)
+
+        return [duel for duel, right in zip(duels, checks) if not right]
 
     def __str__(self):
         """Name of the group."""
         return self.name
 
-    def _read_csv(self, url: str) -> list[dict[str, str]]:
-        """Fetch URL and return CSV object."""
-        result: list[dict[str, str]] = []
-
-        with request.urlopen(url) as resp:
-            lines = [line.decode("utf-8") for line in resp.readlines()]
-            csv_reader = csv.DictReader(lines)
+    def _read_csv(self, url: str) -> Iterator[dict[str, str]]:
+        """Fetch URL and yield CSV rows."""
+        return Sheets().read_csv(url)
 
-            for row in csv_reader:
-                result.append(row)
 
-        return result
+# pylint: enable=too-many-instance-attributes
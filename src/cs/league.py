@@ -1,55 +1,286 @@
 """Module containg Carcassonne Spain League class."""
 
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 from functools import cache
-from typing import Optional
+from typing import Iterable, Optional
 
 from src.cs.group import Group
-from src.settings import config
+from src.cs.player_index import PlayerIndex
+from src.settings import config, logger
+
+PREFETCH_WORKERS = 8
+STORE_MAX_AGE = 3600  # in seconds, older stored data is synced before use
+LOADED_SEASONS = 2  # Seasons kept loaded in memory by LeagueRegistry
+REFRESH_INTERVAL = 300  # in seconds, between checks for data about to expire
+REFRESH_MARGIN = 600  # in seconds, data expiring sooner is revalidated
 
 
-@cache
 class League:
     """Represent Carcassonne Spain League tournament.
 
     The league is divided in separate groups that act
     as separate tournements themselves.
 
-    @cache decorator is used so only a single instance of
-    this class exists.
+    Use LeagueRegistry().league(season) to get a league,
+    so a single instance per season is loaded.
     """
 
     def __init__(self, season: Optional[int] = None):
         """Initialize Carcassonne Spain League object."""
-        if season:
-            self.season = season
-        else:
-            self.season = max(int(cnf["season"]) for cnf in config["league"])
-
+        self.season = season or LeagueRegistry().latest
         self._groups: list[Group] = []
+        self._groups_by_name: dict[str, Group] = {}
+        self._lock = threading.Lock()
+        self._player_index: Optional[PlayerIndex] = None
+        self._player_index_lock = threading.Lock()
 
     @property
     def groups(self) -> list[Group]:
         """List of groups within the League."""
-        cnf_groups = [
-            cnf["groups"] for cnf in config["league"] if cnf["season"] == self.season
-        ]
-        if cnf_groups:
-            cnf_groups = cnf_groups[0]
-        else:
-            raise ValueError(f"Season {self.season} not found")
+        cnf_groups = LeagueRegistry().groups_config(self.season)
 
-        if not self._groups:
-            group_names = sorted(
-                cnf_groups, key=lambda group: cnf_groups[group]["order"]
-            )
-            self._groups = [Group(name, cnf_groups[name]) for name in group_names]
+        with self._lock:
+            if not self._groups:
+                self._load(cnf_groups)
 
         return self._groups
 
+    @property
+    def version(self) -> Optional[tuple[int, ...]]:
+        """Versions of the data of every group, see Group.version.
+
+        None if data of any group must be built first.
+        """
+        versions: list[int] = []
+        for group in self.groups:
+            version = group.version
+            if version is None:
+                return None
+            versions.append(version)
+
+        return tuple(versions)
+
+    @property
+    def player_index(self) -> PlayerIndex:
+        """Players of every group and their duels, see PlayerIndex.
+
+        The index is rebuilt when the data of any group changed since
+        it was built, otherwise the same one is returned.
+        """
+        index = self._player_index
+        if index is None or not self._is_current(index):
+            index = self._rebuild_player_index()
+
+        return index
+
+    def _is_current(self, index: PlayerIndex) -> bool:
+        """Check index was built from the data groups have now."""
+        return index.version is not None and index.version == self.version
+
+    def _rebuild_player_index(self) -> PlayerIndex:
+        """Build the player index again, unless another thread just did it."""
+        with self._player_index_lock:
+            index = self._player_index
+            if index is None or not self._is_current(index):
+                index = self._player_index = PlayerIndex(self.groups)
+
+        return index
+
+    def _load(self, cnf_groups: dict[str, dict[str, str]]):
+        """Build groups, from the store if possible, and fetch their data."""
+        groups = [Group(name, cnf, self.season) for name, cnf in cnf_groups.items()]
+        self._groups_by_name = {group.name: group for group in groups}
+        self._groups = groups
+
+        max_age = config.get("store", {}).get("max_age", STORE_MAX_AGE)
+        loaded = [group.load(max_age) for group in groups]
+        if all(loaded):
+            threading.Thread(
+                target=self._prefetch, args=(groups,), name="league-sync", daemon=True
+            ).start()
+        else:
+            self._prefetch(groups)
+
+    def prefetch(self) -> dict[str, float]:
+        """Fetch the sheets of every group concurrently and refresh group caches.
+
+        Downloads are run in a thread pool, so a cold league costs roughly
+        the slowest sheet instead of the sum of all of them.
+        Groups with any sheet that fails are not refreshed, they keep
+        the data they had, or fetch it again on first use.
+
+        When groups were loaded from the store this runs in a background
+        thread, syncing groups, and the store, with the sheets.
+
+        Returns
+        -------
+        Seconds spent fetching each sheet, keyed by "{group}/{sheet}".
+        """
+        return self._prefetch(self.groups)
+
+    def _prefetch(self, groups: list[Group]) -> dict[str, float]:
+        """Fetch the sheets of groups concurrently and refresh their caches."""
+        timings: dict[str, float] = {}
+        with ThreadPoolExecutor(max_workers=PREFETCH_WORKERS) as executor:
+            futures = {
+                executor.submit(group.fetch, sheet): f"{group}/{sheet}"
+                for group in groups
+                for sheet in group.sheets
+            }
+            for future in as_completed(futures):
+                key = futures[future]
+                try:
+                    timings[key] = future.result()
+                except (OSError, ValueError) as e:
+                    logger.warning("Could not prefetch %s: %s", key, e)
+                    continue
+
+                logger.info("Prefetched %s in %.3fs", key, timings[key])
+
+        for group in groups:
+            if all(f"{group}/{sheet}" in timings for sheet in group.sheets):
+                group.refresh()
+
+        return timings
+
+    def revalidate(self, margin: float) -> list[Group]:
+        """Revalidate, concurrently, groups whose data expires within margin.
+
+        Returns the groups revalidated.
+        """
+        due = [group for group in self.groups if group.expires_in() < margin]
+        with ThreadPoolExecutor(max_workers=PREFETCH_WORKERS) as executor:
+            done = list(executor.map(Group.revalidate, due))
+        revalidated = [group for group, ok in zip(due, done) if ok]
+
+        # Rebuild the player index now, not on the next search
+        if revalidated and self._player_index is not None:
+            self._rebuild_player_index()
+
+        return revalidated
+
     def group(self, name: str) -> Group:
         """Fetch group by name."""
-        for group in self.groups:
-            if group.name == name:
-                return group
+        _ = self.groups  # Load groups, and their index, if needed
+        try:
+            return self._groups_by_name[name]
+        except KeyError:
+            raise LookupError(f"Group '{name}' not found in League") from None
+
+
+@cache
+class LeagueRegistry:
+    """Index league config and keep recently used seasons loaded.
+
+    Config is indexed once by season and group name. Seasons are loaded
+    on demand, at most once at a time, and only the most recently used
+    ones are kept in memory.
+
+    @cache decorator is used so only a single instance of
+    this class exists.
+    """
+
+    def __init__(self):
+        """Index league config by season and group name."""
+        self._config: dict[int, dict[str, dict[str, str]]] = {}
+        for cnf in config["league"]:
+            groups = sorted(cnf["groups"].items(), key=lambda item: item[1]["order"])
+            self._config[int(cnf["season"])] = dict(groups)
+
+        self.latest = max(self._config)
+        self.max_seasons = int(config.get("loaded_seasons", LOADED_SEASONS))
+        self._leagues: OrderedDict[int, League] = OrderedDict()
+        self._loading: dict[int, Future[League]] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def seasons(self) -> list[int]:
+        """Seasons found in config."""
+        return sorted(self._config)
+
+    @property
+    def loaded(self) -> list[int]:
+        """Seasons kept loaded, least recently used first."""
+        with self._lock:
+            return list(self._leagues)
+
+    def groups_config(self, season: int) -> dict[str, dict[str, str]]:
+        """Return config of the groups in a season, keyed by name, in order."""
+        try:
+            return self._config[season]
+        except KeyError:
+            raise ValueError(f"Season {season} not found") from None
+
+    def league(self, season: Optional[int] = None) -> League:
+        """Return the league of a season, latest by default, loading it if needed.
+
+        Callers asking for a season being loaded wait for it
+        instead of loading it again.
+        """
+        season = season or self.latest
+        self.groups_config(season)
+
+        with self._lock:
+            league = self._leagues.get(season)
+            if league is not None:
+                self._leagues.move_to_end(season)
+                return league
+
+            future = self._loading.get(season)
+            loading = future is not None
+            if future is None:
+                future = Future[League]()
+                self._loading[season] = future
+
+        if loading:
+            return future.result()
+
+        try:
+            league = League(season)
+            _ = league.groups
+        except BaseException as e:
+            with self._lock:
+                del self._loading[season]
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            del self._loading[season]
+            self._leagues[season] = league
+            while len(self._leagues) > self.max_seasons:
+                evicted, _ = self._leagues.popitem(last=False)
+                logger.info("Unloaded season %d", evicted)
+        future.set_result(league)
+
+        return league
+
+    def revalidate(self, margin: Optional[float] = None) -> list[Group]:
+        """Revalidate data about to expire in every loaded season.
+
+        Meant to be run periodically, so data is fetched again before
+        it expires and readers are never the ones waiting for it.
+
+        Parameters
+        ----------
+            margin Data expiring within these seconds is revalidated,
+                   refresh.margin in config by default.
+        """
+        if margin is None:
+            margin = float(config.get("refresh", {}).get("margin", REFRESH_MARGIN))
+
+        with self._lock:
+            leagues = list(self._leagues.values())
+
+        return [group for league in leagues for group in league.revalidate(margin)]
+
+    def load(self, seasons: Iterable[int]) -> list[League]:
+        """Load several seasons concurrently and return their leagues.
 
-        raise LookupError(f"Group '{name}' not found in League")
+        Loading more than max_seasons seasons unloads
+        the first ones once the rest are loaded.
+        """
+        seasons = list(seasons)
+        with ThreadPoolExecutor(max_workers=max(len(seasons), 1)) as executor:
+            return list(executor.map(self.league, seasons))
@@ -1,21 +1,35 @@
 """Module for Carcassonne Spain Player class."""
 
+import sys
+from typing import Optional
+
 from src.settings import config
 
 
 class Player:
     """Represent a Carcassonne Spain league player."""
 
+    __slots__ = ("id", "name", "telegram", "_url")
+
     def __init__(self, player_id: int, name: str, telegram: str = ""):
         """Build a player."""
         self.id = player_id
-        self.name = name
-        self.url = config["bga"]["urls"]["player_link"].format(player_id)
+        self.name = sys.intern(name)
+        self.telegram = ""
+        self._url: Optional[str] = None
         if telegram:
             if telegram.startswith("@"):
-                self.telegram = telegram
+                self.telegram = sys.intern(telegram)
             else:
-                self.telegram = f"@${telegram}"
+                self.telegram = sys.intern(f"@${telegram}")
+
+    @property
+    def url(self) -> str:
+        """BGA profile url of the player."""
+        url = self._url
+        if url is None:
+            url = self._url = config["bga"]["urls"]["player_link"].format(self.id)
+        return url
 
     def html(self):
         """Player name with link to BGA profile."""
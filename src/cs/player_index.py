@@ -0,0 +1,144 @@
+"""Module for Carcassonne Spain PlayerIndex class."""
+
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import date
+from typing import Iterable, Optional
+
+from src.cs.date import local_date
+from src.cs.duel import Duel
+from src.cs.group import Group
+from src.cs.player import Player
+from src.settings import logger
+
+MATCHES = 5  # Players returned by a search, at most
+SIMILARITY = 0.3  # Share of trigrams a name needs in common with a search
+
+
+# pylint: disable=too-many-instance-attributes
+class PlayerIndex:
+    """Players of a league, their group and their duels, by player id.
+
+    Players are searched by name: exact matches first, then names
+    starting with the search, then names sharing enough trigrams with it,
+    so typos still find the player. Every search is answered from the
+    indexes, without going through the groups.
+
+    The index is a snapshot, build a new one when group data changes.
+    """
+
+    def __init__(self, groups: Iterable[Group]):
+        """Index players and duels of groups, building their data if needed."""
+        self.players: dict[int, Player] = {}
+        self.groups: dict[int, str] = {}
+        self._played: dict[int, list[Duel]] = defaultdict(list)
+        self._scheduled: dict[int, list[Duel]] = defaultdict(list)
+        self._by_name: dict[str, list[int]] = defaultdict(list)
+        self._trigrams: dict[str, set[int]] = defaultdict(set)
+        self._trigram_counts: dict[int, int] = {}
+
+        versions: list[Optional[int]] = []
+        for group in groups:
+            version = group.version
+            self._add_group(group)
+            versions.append(version if version is not None else group.version)
+        self.version = None if None in versions else tuple(versions)
+
+        self._names = sorted(self._by_name)
+        for played in self._played.values():
+            played.sort(key=_played_at)
+        for scheduled in self._scheduled.values():
+            scheduled.sort(key=lambda duel: duel.planned)
+
+    def _add_group(self, group: Group):
+        """Index players and duels of a group."""
+        try:
+            players, schedule, outcome = group.players, group.schedule, group.outcome
+        except (LookupError, ValueError, KeyError) as e:
+            logger.warning("Could not index players of %s group: %s", group, e)
+            return
+
+        for player in players:
+            if player.id in self.players:
+                continue
+            self.players[player.id] = player
+            self.groups[player.id] = group.name
+            name = player.name.casefold()
+            self._by_name[name].append(player.id)
+            trigrams = _trigrams(name)
+            for trigram in trigrams:
+                self._trigrams[trigram].add(player.id)
+            self._trigram_counts[player.id] = len(trigrams)
+
+        for duel in schedule:
+            self._scheduled[duel.p1.id].append(duel)
+            self._scheduled[duel.p2.id].append(duel)
+        for duel in outcome:
+            self._played[duel.p1.id].append(duel)
+            self._played[duel.p2.id].append(duel)
+
+    def search(self, name: str, limit: int = MATCHES) -> list[Player]:
+        """Return players best matching a name, best first.
+
+        Exact matches, ignoring case, are returned alone. Otherwise names
+        starting with name, or failing that similar to it, up to limit.
+        """
+        name = name.strip().casefold()
+        if not name:
+            return []
+
+        exact = self._by_name.get(name)
+        if exact:
+            return [self.players[player_id] for player_id in exact]
+
+        ids: list[int] = []
+        start = bisect_left(self._names, name)
+        for found in self._names[start:]:
+            if not found.startswith(name) or len(ids) >= limit:
+                break
+            ids.extend(self._by_name[found])
+        if not ids:
+            ids = self._similar(name)
+
+        return [self.players[player_id] for player_id in ids[:limit]]
+
+    def _similar(self, name: str) -> list[int]:
+        """Return ids of players with names similar to name, most similar first."""
+        trigrams = _trigrams(name)
+        shared: dict[int, int] = defaultdict(int)
+        for trigram in trigrams:
+            for player_id in self._trigrams.get(trigram, ()):
+                shared[player_id] += 1
+
+        scores: list[tuple[float, str, int]] = []
+        for player_id, count in shared.items():
+            total = len(trigrams) + self._trigram_counts[player_id] - count
+            similarity = count / total
+            if similarity >= SIMILARITY:
+                scores.append((-similarity, self.players[player_id].name, player_id))
+
+        return [player_id for _, _, player_id in sorted(scores)]
+
+    def played(self, player_id: int) -> list[Duel]:
+        """Return duels a player already played, by outcome date."""
+        return list(self._played.get(player_id, ()))
+
+    def upcoming(self, player_id: int, since: date) -> list[Duel]:
+        """Return duels of a player planned from since on, by planned date."""
+        scheduled = self._scheduled.get(player_id, [])
+        start = bisect_left(scheduled, since, key=lambda duel: local_date(duel.planned))
+        return scheduled[start:]
+
+
+# pylint: enable=too-many-instance-attributes
+
+
+def _trigrams(name: str) -> set[str]:
+    """Return trigrams of a name, padded so short names and starts count."""
+    padded = f"  {name} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def _played_at(duel: Duel):
+    """Return when a duel was played, for sorting."""
+    return duel.outcome_timestamp or duel.planned
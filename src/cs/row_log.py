@@ -0,0 +1,64 @@
+"""Module for Carcassonne Spain RowLog class."""
+
+import hashlib
+from typing import Iterable, Iterator
+
+
+class RowLog:
+    """Fingerprints of the rows ingested from an append-only sheet.
+
+    Lets a refresh skip the rows already ingested and parse only
+    the ones added since, or the ones after a row that was edited.
+    """
+
+    def __init__(self):
+        """Build an empty log."""
+        self._digests: list[bytes] = []
+        self.kept = 0
+
+    def diff(self, rows: Iterable[dict[str, str]]) -> Iterator[dict[str, str]]:
+        """Yield rows not ingested yet.
+
+        Leading rows matching the log are skipped, every row from the
+        first one that differs on is yielded. Once exhausted, `kept` holds
+        the number of rows skipped and the log matches the sheet.
+        """
+        old = self._digests
+        new: list[bytes] = []
+        kept = 0
+        matching = True
+        for row in rows:
+            digest = _digest(row)
+            new.append(digest)
+            if matching and kept < len(old) and old[kept] == digest:
+                kept += 1
+                continue
+
+            matching = False
+            yield row
+
+        self._digests = new
+        self.kept = kept
+
+    def copy(self) -> "RowLog":
+        """Return a log of the same rows, that diffs apart from this one."""
+        log = RowLog()
+        # pylint: disable-next=protected-access
+        log._digests = self._digests  # Replaced, never changed, by diff
+        log.kept = self.kept
+        return log
+
+    def clear(self):
+        """Forget every row, so the next refresh ingests the whole sheet."""
+        self._digests = []
+        self.kept = 0
+
+    def __len__(self) -> int:
+        """Return number of rows ingested."""
+        return len(self._digests)
+
+
+def _digest(row: dict[str, str]) -> bytes:
+    """Fingerprint of a row."""
+    data = repr(list(row.items())).encode("utf-8")
+    return hashlib.blake2b(data, digest_size=16).digest()
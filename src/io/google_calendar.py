@@ -1,18 +1,16 @@
 """Module for Carcassonne Spain Google Calendar."""
 
 from datetime import date, datetime, timedelta
-from functools import cache
+from functools import cache, cached_property
 from typing import Any, Optional
 
 from cachetools.func import ttl_cache
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
 
 from src.cs.duel import Duel
 from src.cs.group import Group
-from src.cs.league import League
 from src.io.io_base import IoBase
 from src.settings import config, logger
+from src.transport import REPLAY, google_http, transport_mode
 
 SCOPES = ["https://www.googleapis.com/auth/calendar"]
 CACHE_TTL = 3600  # in seconds
@@ -24,14 +22,34 @@ class GCalendar(IoBase):
 
     def __init__(self, season: Optional[int] = None):
         """Initialize the GCalendar object."""
-        self.league = League(season)
+        self.season = season
         self.calendar_id = config["google"]["calendar_id"]
-        # TODO: Move token.json to config.yml
-        creds = Credentials.from_authorized_user_file("token.json", SCOPES)
+        self._events: dict[date, list[Any]] = {}
+
+    @cached_property
+    def event_mgr(self) -> Any:
+        """Google Calendar events resource.
+
+        Google libraries are only imported, and credentials read,
+        once an event is fetched or published. No credentials are
+        needed when replaying recorded exchanges.
+        """
+        # pylint: disable=import-outside-toplevel
+        from google.oauth2.credentials import Credentials
+        from google_auth_httplib2 import AuthorizedHttp
+        from googleapiclient.discovery import build
+        from googleapiclient.http import build_http
+
+        # pylint: enable=import-outside-toplevel
+
+        http = None
+        if transport_mode() != REPLAY:
+            # TODO: Move token.json to config.yml
+            creds = Credentials.from_authorized_user_file("token.json", SCOPES)
+            http = AuthorizedHttp(creds, http=build_http())
 
         # pylint: disable=E1101
-        self.event_mgr = build("calendar", "v3", credentials=creds).events()
-        self._events: dict[date, list[Any]] = {}
+        return build("calendar", "v3", http=google_http("gcalendar", http)).events()
 
     def _summary(self, duel: Duel) -> str:
         return f"{duel.p1.name} - {duel.p2.name}"
@@ -2,12 +2,21 @@
 
 from abc import ABC, abstractmethod
 from datetime import date, timedelta
-from typing import Any
+from typing import Any, Optional
+
+from src.cs.league import League, LeagueRegistry
 
 
 class IoBase(ABC):
     """Base IO class."""
 
+    season: Optional[int] = None
+
+    @property
+    def league(self) -> League:
+        """League of the season, latest by default."""
+        return LeagueRegistry().league(self.season)
+
     @abstractmethod
     def create_msg(
         self, query_date: date, force_schedule: bool = False
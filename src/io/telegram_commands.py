@@ -10,13 +10,14 @@ from typing import Optional
 from telegram import Update
 from telegram.ext import ContextTypes
 
+from src.cs.league import LeagueRegistry
 from src.io.telegram_cs import Telegram
 
 
 def _parse_date(update: Update) -> Optional[date]:
     msg = update.message.text
     params = msg.split(" ")
-    if len(params) == 2:
+    if len(params) in (2, 3):
         str_date = params[1]
         try:
             # Try YYYY-mm-dd format
@@ -31,13 +32,34 @@ def _parse_date(update: Update) -> Optional[date]:
     return None
 
 
+def _parse_season(update: Update) -> Optional[int]:
+    params = update.message.text.split(" ")
+    if len(params) == 3 and params[2].isdigit():
+        return int(params[2])
+
+    return None
+
+
+async def _create_msg(
+    update: Update, query_date: date, force_schedule: bool = False
+) -> str:
+    season = _parse_season(update)
+    if season is not None and season not in LeagueRegistry().seasons:
+        return f"Season {season} not found"
+
+    msgs = await Telegram(season).create_msg_async(query_date, force_schedule)
+    return msgs[0]
+
+
 # pylint: disable=redefined-builtin
 async def help(update: Update, _: ContextTypes.DEFAULT_TYPE) -> None:
     """Describe the set of available commands."""
     await update.message.reply_text(
         """Available Commands :-
-    /schedule [dd/mm/yy] - Get duels for a given date (today by default)
-    /results [dd/mm/yy] - Get duels outcome for a given date (yesterday by default)"""
+    /schedule [dd/mm/yy] [season] - Get duels for a given date (today by default)
+    /results [dd/mm/yy] [season] - Get duels outcome for a given date (yesterday by default)
+    /player <name> [season] - Get upcoming and played duels of a player
+Season is the last one by default."""
     )
 
 
@@ -47,7 +69,7 @@ async def help(update: Update, _: ContextTypes.DEFAULT_TYPE) -> None:
 async def schedule(update: Update, _: ContextTypes.DEFAULT_TYPE) -> None:
     """Reply with the set of the next scheduled duels."""
     query_date = _parse_date(update) or date.today()
-    msg = Telegram().create_msg(query_date, force_schedule=True)[0]
+    msg = await _create_msg(update, query_date, force_schedule=True)
 
     if msg:
         await update.message.reply_html(msg, disable_web_page_preview=True)
@@ -58,7 +80,27 @@ async def schedule(update: Update, _: ContextTypes.DEFAULT_TYPE) -> None:
 async def results(update: Update, _: ContextTypes.DEFAULT_TYPE) -> None:
     """Reply with the set of the last results."""
     query_date = _parse_date(update) or date.today() - timedelta(1)
-    msg = Telegram().create_msg(query_date)[0]
+    msg = await _create_msg(update, query_date)
+
+    if msg:
+        await update.message.reply_html(msg, disable_web_page_preview=True)
+    else:
+        await update.message.reply_text("Nothing found")
+
+
+async def player(update: Update, _: ContextTypes.DEFAULT_TYPE) -> None:
+    """Reply with the upcoming and played duels of a player."""
+    params = update.message.text.split(" ")
+    if len(params) < 2 or not params[1]:
+        await update.message.reply_text("Usage: /player <name> [season]")
+        return
+
+    season = _parse_season(update)
+    if season is not None and season not in LeagueRegistry().seasons:
+        await update.message.reply_text(f"Season {season} not found")
+        return
+
+    msg = await Telegram(season).player_msg_async(params[1])
 
     if msg:
         await update.message.reply_html(msg, disable_web_page_preview=True)
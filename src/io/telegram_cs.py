@@ -3,15 +3,161 @@
 
 """Telegram message creation."""
 import asyncio
+import atexit
+import html
+import threading
+import time
 from datetime import date
-from typing import Optional
+from functools import cache
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Optional, TypeVar
 
-import telegram
-from telegram.ext import Application
+from cachetools import LRUCache
 
-from src.cs.league import League
+from src.cs.date import local_date
+from src.cs.duel import Duel
 from src.io.io_base import IoBase
+from src.rate_limit import TokenBucket
 from src.settings import config, logger
+from src.transport import telegram_request
+
+if TYPE_CHECKING:
+    import telegram
+    import telegram.ext
+
+CONCURRENT_UPDATES = 32  # Updates handled at once, default is one by one
+MESSAGES_SIZE = 256  # Rendered messages kept, for different dates and seasons
+# Telegram limits bots to about 30 messages per second, 20 per minute in a group
+GLOBAL_RATE = 25  # Messages per second
+CHAT_RATE = 20 / 60  # Messages per second to a single chat
+MAX_RETRIES = 3  # Sends retried after flood control, per chat
+POOL_SIZE = 16  # Connections to Telegram kept open by the shared client
+PLAYED_SHOWN = 10  # Last results of a player shown by /player
+
+# (season, date, force_schedule, header) -> (league version, messages)
+MessageKey = tuple[int, date, bool, str]
+_messages = LRUCache[MessageKey, tuple[tuple[int, ...], list[str]]](MESSAGES_SIZE)
+_messages_lock = threading.Lock()
+_chat_limiters: dict[Any, TokenBucket] = {}
+_chat_limiters_lock = threading.Lock()
+
+T = TypeVar("T")
+
+
+def build_application(
+    concurrent_updates: Optional[int] = None,
+) -> "telegram.ext.Application":
+    """Build the bot application, talking to Telegram through the transport.
+
+    Updates are handled concurrently, so a chat waiting for data
+    does not hold the ones coming after it. Up to concurrent_updates
+    at once, telegram.concurrent_updates by default.
+    """
+    # pylint: disable-next=import-outside-toplevel
+    from telegram.ext import Application
+
+    cnf = config["telegram"]
+    builder = (
+        Application.builder()
+        .token(cnf["token"])
+        .concurrent_updates(
+            concurrent_updates or int(cnf.get("concurrent_updates", CONCURRENT_UPDATES))
+        )
+    )
+    request = telegram_request()
+    if request is not None:
+        builder = builder.request(request).get_updates_request(telegram_request())
+
+    return builder.build()
+
+
+@cache
+class TelegramClient:
+    """Long lived bot, and pool of connections, shared by every send.
+
+    Connections belong to the event loop they were opened in, so the bot
+    lives in an event loop of its own, run by a background thread, and
+    sends from any thread or loop are run there. The bot is started on
+    first use and kept until close(), called at exit at the latest.
+
+    @cache decorator is used so only a single instance of
+    this class exists.
+    """
+
+    def __init__(self):
+        """Prepare the client, nothing is started until it is used."""
+        self._bot: Optional["telegram.Bot"] = None
+        self._bot_lock: Optional[asyncio.Lock] = None  # Belongs to the loop
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        atexit.register(self.close)
+
+    def run(self, send: Callable[["telegram.Bot"], Awaitable[T]]) -> T:
+        """Run send with the shared bot, waiting for its result."""
+        future = asyncio.run_coroutine_threadsafe(self._call(send), self._start())
+        return future.result()
+
+    async def run_async(self, send: Callable[["telegram.Bot"], Awaitable[T]]) -> T:
+        """Run send with the shared bot, from a coroutine in any event loop."""
+        future = asyncio.run_coroutine_threadsafe(self._call(send), self._start())
+        return await asyncio.wrap_future(future)
+
+    def close(self):
+        """Shut the bot down and stop its event loop, if started."""
+        with self._lock:
+            loop, thread, bot = self._loop, self._thread, self._bot
+            self._loop = self._thread = self._bot = self._bot_lock = None
+
+        if loop is None or thread is None:
+            return
+
+        try:
+            if bot is not None:
+                asyncio.run_coroutine_threadsafe(bot.shutdown(), loop).result()
+        finally:
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+
+    def _start(self) -> asyncio.AbstractEventLoop:
+        """Return the event loop of the client, starting it if needed."""
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(
+                    target=loop.run_forever, name="telegram-client", daemon=True
+                )
+                self._thread.start()
+                self._loop = loop
+
+            return self._loop
+
+    async def _call(self, send: Callable[["telegram.Bot"], Awaitable[T]]) -> T:
+        """Run send in the loop of the client, building the bot if needed.
+
+        Sends arriving while the bot is initialized wait for it,
+        so a single bot is ever built.
+        """
+        if self._bot_lock is None:
+            self._bot_lock = asyncio.Lock()
+        async with self._bot_lock:
+            if self._bot is None:
+                bot = self._build_bot()
+                await bot.initialize()
+                self._bot = bot
+
+        return await send(self._bot)
+
+    def _build_bot(self) -> "telegram.Bot":
+        """Build a bot with a pool of connections, through the transport."""
+        # pylint: disable=import-outside-toplevel
+        from telegram import Bot
+        from telegram.request import HTTPXRequest
+
+        # pylint: enable=import-outside-toplevel
+
+        request = telegram_request() or HTTPXRequest(connection_pool_size=POOL_SIZE)
+        return Bot(config["telegram"]["token"], request=request)
 
 
 class Telegram(IoBase):
@@ -19,10 +165,52 @@ class Telegram(IoBase):
 
     def __init__(self, season: Optional[int] = None):
         """Initialize the Telegram object."""
-        self.league = League(season)
+        self.season = season
 
     def create_msg(self, query_date: date, force_schedule: bool = False) -> list[str]:
-        """Return a string corresponding to the expected summary type."""
+        """Return a string corresponding to the expected summary type.
+
+        Messages are kept until the data of the league changes, so asking
+        again for the same one does not go through the groups.
+        """
+        league = self.league
+        header = self._header(query_date, force_schedule)
+        key = (league.season, query_date, force_schedule, header)
+
+        version = league.version
+        with _messages_lock:
+            cached = _messages.get(key)
+        if cached is not None and version is not None and cached[0] == version:
+            return list(cached[1])
+
+        msgs = self._render(query_date, header, force_schedule)
+
+        # Data built while rendering is the one before, unless it changed
+        rendered = league.version
+        if rendered is not None and version in (None, rendered):
+            with _messages_lock:
+                _messages[key] = (rendered, msgs)
+
+        return list(msgs)
+
+    async def create_msg_async(
+        self, query_date: date, force_schedule: bool = False
+    ) -> list[str]:
+        """Return messages like create_msg, from a worker thread.
+
+        Fetching and parsing sheets does not block the event loop,
+        which keeps serving other chats in the meantime.
+        """
+        return await asyncio.to_thread(self.create_msg, query_date, force_schedule)
+
+    def _header(self, query_date: date, force_schedule: bool) -> str:
+        """Return kind of header for a message, schedule or results."""
+        if force_schedule or query_date >= date.today():
+            return "schedule"
+        return "results"
+
+    def _render(self, query_date: date, header: str, force_schedule: bool) -> list[str]:
+        """Build message with duels of every group for a date."""
         html_body = ""
         for group in self.league.groups:
             name = group.name
@@ -34,39 +222,142 @@ class Telegram(IoBase):
         if not html_body:
             return [""]
 
-        # Add header
-        if force_schedule or query_date >= date.today():
-            header = config["telegram"]["header"]["schedule"]
-        else:
-            header = config["telegram"]["header"]["results"]
+        return [f"{config['telegram']['header'][header]}{html_body}"]
+
+    def player_msg(self, name: str) -> str:
+        """Return a message with upcoming and played duels of a player.
 
-        return [f"{header}{html_body}"]
+        Players are looked up in the player index of the league, so
+        names with typos are found too. When several players match,
+        the message lists them instead. Empty if none matches.
+        """
+        index = self.league.player_index
+        players = index.search(name)
+        if not players:
+            return ""
+
+        player = players[0]
+        if len(players) > 1 and player.name.casefold() != name.strip().casefold():
+            names = ", ".join(p.html() for p in players)
+            return f"Several players match {html.escape(name)}: {names}"
+
+        upcoming = index.upcoming(player.id, date.today())
+        played = index.played(player.id)[-PLAYED_SHOWN:]
+        msg = f"<b>{player.html()}</b> ({index.groups[player.id]})"
+        for title, duels in (("Upcoming", upcoming), ("Results", played)):
+            if duels:
+                msg += f"\n\n<b>{title}</b>:\n"
+                msg += "\n".join(f"{_day(duel)} {duel.html()}" for duel in duels)
+
+        return msg
+
+    async def player_msg_async(self, name: str) -> str:
+        """Return message like player_msg, from a worker thread."""
+        return await asyncio.to_thread(self.player_msg, name)
 
     def send(self, query_date: date, force_schedule: bool = False) -> None:
-        """Send Telgram message with duels schedule/outcome for a date."""
-        token = config["telegram"]["token"]
-        application = Application.builder().token(token).build()
-        bot = application.bot
-        asyncio.run(self.send_async(bot, query_date, force_schedule))
+        """Send Telgram message with duels schedule/outcome for a date.
+
+        Messages are sent by the shared TelegramClient, so sending
+        many of them reuses its connections.
+        """
+        TelegramClient().run(
+            lambda bot: self.send_async(bot, query_date, force_schedule)
+        )
 
     async def send_async(
-        self, bot: telegram.Bot, query_date: date, force_schedule: bool = False
-    ):
-        """Send Telegram message with duels schedule/outcome for a date."""
-        msg = self.create_msg(query_date, force_schedule)[0]
+        self, bot: "telegram.Bot", query_date: date, force_schedule: bool = False
+    ) -> dict[Any, float]:
+        """Send Telegram message with duels schedule/outcome for a date.
+
+        Message is sent to every configured chat at once, within Telegram
+        rate limits. A chat failing does not stop the others, the first
+        error is raised once every chat was tried.
+
+        Returns
+        -------
+        Seconds it took to deliver the message, keyed by chat id.
+        """
+        msg = (await self.create_msg_async(query_date, force_schedule))[0]
 
         if not msg:
-            return
+            return {}
+
+        groups = config["telegram"]["groups"]
+        results = await asyncio.gather(
+            *(_deliver(bot, group, msg) for group in groups), return_exceptions=True
+        )
+
+        latencies: dict[Any, float] = {}
+        errors: list[BaseException] = []
+        for group, result in zip(groups, results):
+            if isinstance(result, BaseException):
+                logger.error("Could not send message to %s: %s", group["id"], result)
+                errors.append(result)
+            else:
+                latencies[group["id"]] = result
+
+        if errors:
+            raise errors[0]
+
+        return latencies
+
+
+def _day(duel: Duel) -> str:
+    """Return the local day a duel was played, or is planned, as dd/mm."""
+    return local_date(duel.outcome_timestamp or duel.planned).strftime("%d/%m")
+
 
-        for group in config["telegram"]["groups"]:
-            group_id = group["id"]
-            thread_id = group.get("thread_id")
-            logger.info("Going to send message to %s", group_id)
+async def _deliver(bot: "telegram.Bot", group: dict[str, Any], msg: str) -> float:
+    """Send message to a chat, backing off when flood control kicks in.
 
+    Returns seconds it took, waits for rate limits included.
+    """
+    # pylint: disable=import-outside-toplevel
+    from telegram.constants import ParseMode
+    from telegram.error import RetryAfter
+
+    # pylint: enable=import-outside-toplevel
+
+    start = time.perf_counter()
+    group_id = group["id"]
+    for attempt in range(MAX_RETRIES + 1):
+        await _chat_limiter(group_id).acquire_async()
+        await _global_limiter().acquire_async()
+        try:
             await bot.send_message(
                 chat_id=group_id,
                 text=msg,
-                message_thread_id=thread_id,
-                parse_mode=telegram.constants.ParseMode.HTML,
+                message_thread_id=group.get("thread_id"),
+                parse_mode=ParseMode.HTML,
                 disable_web_page_preview=True,
             )
+            break
+        except RetryAfter as e:
+            if attempt == MAX_RETRIES:
+                raise
+            logger.warning(
+                "Flood control for %s, retry in %ss", group_id, e.retry_after
+            )
+            await asyncio.sleep(float(e.retry_after))
+
+    latency = time.perf_counter() - start
+    logger.info("Sent message to %s in %.3fs", group_id, latency)
+    return latency
+
+
+@cache
+def _global_limiter() -> TokenBucket:
+    """Return the limiter shared by messages to every chat."""
+    rate = float(config["telegram"].get("rate", {}).get("global", GLOBAL_RATE))
+    return TokenBucket(rate, burst=max(int(rate), 1))
+
+
+def _chat_limiter(chat_id: Any) -> TokenBucket:
+    """Return the limiter of messages to a chat."""
+    with _chat_limiters_lock:
+        limiter = _chat_limiters.get(chat_id)
+        if limiter is None:
+            rate = float(config["telegram"].get("rate", {}).get("chat", CHAT_RATE))
+            limiter = _chat_limiters[chat_id] = TokenBucket(rate)
+        return limiter
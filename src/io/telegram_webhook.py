@@ -0,0 +1,189 @@
+"""Module for receiving Telegram updates through a webhook."""
+
+import asyncio
+import concurrent.futures
+import hmac
+import json
+import signal
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Optional
+
+from telegram import Update
+from telegram.ext import Application
+
+from src.settings import config, logger
+
+LISTEN = "127.0.0.1"
+PORT = 8443
+PATH = "/telegram"
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+MAX_BODY = 1024 * 1024  # in bytes, updates are a few KB at most
+QUEUE_TIMEOUT = 10  # in seconds, waiting for the application to take an update
+
+
+class WebhookServer:
+    """Receive Telegram updates over HTTP and queue them for an application.
+
+    Requests are answered as soon as their update is queued. Handlers run
+    in the application, as many at once as its concurrent updates allow.
+    Requests without the secret token given to Telegram are rejected.
+    """
+
+    # pylint: disable-next=too-many-arguments,too-many-positional-arguments
+    def __init__(
+        self,
+        application: Application,
+        secret_token: str,
+        listen: str = LISTEN,
+        port: int = PORT,
+        path: str = PATH,
+    ):
+        """Build a server, it does not listen until started."""
+        self.application = application
+        self.secret_token = secret_token
+        self.path = path
+        self._server = _Server((listen, port), _Handler, self)
+        self._thread: Optional[threading.Thread] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def address(self) -> tuple[str, int]:
+        """Host and port the server listens on."""
+        host, port = self._server.server_address[:2]
+        return str(host), int(port)
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        """Serve requests from a thread, queueing updates in loop."""
+        self._loop = loop
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="telegram-webhook", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        """Stop serving and close the socket."""
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def receive(self, secret_token: str, body: bytes) -> int:
+        """Queue the update in a request body, return the HTTP status to answer."""
+        if not hmac.compare_digest(secret_token.encode(), self.secret_token.encode()):
+            logger.warning("Update rejected, wrong secret token")
+            return 403
+
+        try:
+            update = Update.de_json(json.loads(body), self.application.bot)
+        except (ValueError, TypeError, KeyError) as e:
+            logger.warning("Could not parse update: %s", e)
+            return 400
+
+        if update is None or self._loop is None:
+            return 400
+
+        queue = self.application.update_queue
+        future = asyncio.run_coroutine_threadsafe(queue.put(update), self._loop)
+        try:
+            future.result(QUEUE_TIMEOUT)
+        except concurrent.futures.TimeoutError:  # Not the builtin one before 3.11
+            future.cancel()
+            logger.warning("Update dropped, application did not take it in time")
+            return 503
+
+        return 200
+
+
+class _Server(ThreadingHTTPServer):
+    """HTTP server handing requests to a webhook."""
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: tuple[str, int],
+        handler: type[BaseHTTPRequestHandler],
+        webhook: WebhookServer,
+    ):
+        """Build a server, listening on address."""
+        super().__init__(address, handler)
+        self.webhook = webhook
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Answer POSTs of updates to the webhook path."""
+
+    server: _Server
+
+    # pylint: disable-next=invalid-name
+    def do_POST(self):
+        """Queue the update posted."""
+        webhook = self.server.webhook
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+        except ValueError:
+            length = -1
+
+        if self.path != webhook.path:
+            status = 404
+        elif length < 0:
+            status = 400
+        elif length > MAX_BODY:
+            status = 413
+        else:
+            body = self.rfile.read(length)
+            status = webhook.receive(self.headers.get(SECRET_HEADER, ""), body)
+
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    # pylint: disable-next=redefined-builtin
+    def log_message(self, format: str, *args: Any):
+        """Log requests along with everything else."""
+        logger.debug("Webhook %s: %s", self.address_string(), format % args)
+
+
+def run_webhook(application: Application):
+    """Run application, receiving updates through a webhook, until stopped.
+
+    The webhook is registered in Telegram when telegram.webhook.url is
+    configured. Without it, updates can be posted to the server locally.
+    """
+    asyncio.run(_serve(application))
+
+
+async def _serve(application: Application):
+    """Serve updates until SIGINT or SIGTERM."""
+    cnf = config["telegram"].get("webhook", {})
+    secret_token = cnf.get("secret_token")
+    if not secret_token:
+        raise ValueError("telegram.webhook.secret_token is needed for webhooks")
+
+    server = WebhookServer(
+        application,
+        secret_token,
+        cnf.get("listen", LISTEN),
+        int(cnf.get("port", PORT)),
+        cnf.get("path", PATH),
+    )
+
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+
+    async with application:
+        if cnf.get("url"):
+            await application.bot.set_webhook(
+                cnf["url"], secret_token=secret_token, allowed_updates=Update.ALL_TYPES
+            )
+        await application.start()
+        server.start(loop)
+        logger.info("Listening for updates on %s:%d", *server.address)
+        try:
+            await stop.wait()
+        finally:
+            server.stop()
+            await application.stop()
@@ -3,11 +3,9 @@
 from datetime import date
 from typing import Optional
 
-import tweepy
-
-from src.cs.league import League
 from src.io.io_base import IoBase
 from src.settings import config, logger
+from src.transport import mount
 
 
 class Twitter(IoBase):
@@ -15,7 +13,7 @@ class Twitter(IoBase):
 
     def __init__(self, season: Optional[int] = None):
         """Initialize the Tweet object."""
-        self.league = League(season)
+        self.season = season
         self.max_size = 280  # Tweet size
 
     def _make_bold(self, text: str) -> str:
@@ -107,12 +105,15 @@ class Twitter(IoBase):
                            even if query_date is in the past.
                            For testing purposes mainly.
         """
+        import tweepy  # pylint: disable=import-outside-toplevel
+
         client = tweepy.Client(
             consumer_key=config["twitter"]["api_key"],
             consumer_secret=config["twitter"]["api_key_secret"],
             access_token=config["twitter"]["access_token"],
             access_token_secret=config["twitter"]["access_token_secret"],
         )
+        mount(client.session, "twitter")
 
         logger.info("Creating tweet for %s", query_date)
         msgs = self.create_msg(query_date, force_schedule)
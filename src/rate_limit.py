@@ -0,0 +1,58 @@
+"""Module for limiting the rate of requests to a service."""
+
+import asyncio
+import threading
+import time
+
+
+# pylint: disable=too-few-public-methods
+class TokenBucket:
+    """Let callers through at a steady rate, from any number of threads.
+
+    Tokens are added at rate per second, up to burst. Each caller takes
+    one, waiting for it when there is none, so callers from every thread
+    share the same rate. Waits are booked while holding the lock but spent
+    outside it, so callers are let through in the order they arrived.
+
+    Coroutines use acquire_async, which waits without blocking the loop.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        """Build a bucket, no rate limits callers."""
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Take a token, waiting for it if needed. Return seconds waited."""
+        wait = self._take()
+        if wait:
+            time.sleep(wait)
+
+        return wait
+
+    async def acquire_async(self) -> float:
+        """Take a token like acquire, awaiting it instead of sleeping."""
+        wait = self._take()
+        if wait:
+            await asyncio.sleep(wait)
+
+        return wait
+
+    def _take(self) -> float:
+        """Book a token, return seconds to wait until it is available."""
+        if self.rate <= 0:
+            return 0.0
+
+        with self._lock:
+            now = time.monotonic()
+            elapsed = now - self._updated
+            self._tokens = min(self.burst, self._tokens + elapsed * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return max(-self._tokens / self.rate, 0.0)
+
+
+# pylint: enable=too-few-public-methods
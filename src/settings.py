@@ -11,8 +11,11 @@ import yaml
 
 CONFIG_FILE = os.environ.get("CS_CONFIG_FILE", "config.yml")
 
+# libyaml based loader is much faster, when available
+Loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
 with open(CONFIG_FILE, "r", encoding="utf8") as f:
-    config = yaml.safe_load(f)
+    config = yaml.load(f, Loader=Loader)  # nosec B506
 
 logging.basicConfig(
     level=logging.DEBUG, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
@@ -0,0 +1,152 @@
+"""Module for a cache on disk shared by every process on the host."""
+
+import hashlib
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Callable, Generator, Optional
+
+from src.settings import config, logger
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows, entries are not locked there
+    fcntl = None
+
+
+def cache_dir(name: str) -> str:
+    """Return the directory for a kind of cached data."""
+    return os.path.join(config.get("cache", {}).get("dir", ".cache"), name)
+
+
+def cache_ttl(name: str, default: float) -> float:
+    """Return seconds data of a kind stays fresh, as configured."""
+    return float(config.get("cache", {}).get("ttl", {}).get(name, default))
+
+
+def file_age(path: str) -> float:
+    """Return seconds since a file was written, infinite if it does not exist."""
+    try:
+        return time.time() - os.path.getmtime(path)
+    except OSError:
+        return float("inf")
+
+
+@contextmanager
+def file_lock(path: str) -> Generator[None, None, None]:
+    """Hold an exclusive lock on path, waiting for other processes to release it.
+
+    Lock files are never removed, so every process locks the same inode.
+    Failing to open the lock file goes on unlocked.
+    """
+    try:
+        f = open(path, "a", encoding="utf8")  # pylint: disable=consider-using-with
+    except OSError as e:
+        logger.warning("Could not lock %s: %s", path, e)
+        yield
+        return
+
+    with f:  # Closing the file releases the lock
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        yield
+
+
+def write_atomic(path: str, data: bytes):
+    """Write a file so readers never see it half written."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except OSError:
+        os.unlink(tmp_path)
+        raise
+
+
+class SharedCache:
+    """Keep values on disk for every process to use.
+
+    Each key has its own TTL, given when reading it, and its own lock.
+    Only one process refreshes an expired key, the others wait
+    for it and then read the value it stored.
+    """
+
+    def __init__(self, name: str):
+        """Build a cache for a kind of data."""
+        self.directory = cache_dir(name)
+
+    def path(self, key: str) -> str:
+        """Path in the cache for a key, without extension."""
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, digest)
+
+    @contextmanager
+    def lock(self, key: str) -> Generator[None, None, None]:
+        """Hold the lock of a key, so no other process refreshes it."""
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+        except OSError:
+            pass  # Reported by file_lock
+        with file_lock(f"{self.path(key)}.lock"):
+            yield
+
+    def get(self, key: str, ttl: float) -> Optional[bytes]:
+        """Return value for key, None if missing or older than ttl seconds."""
+        path = f"{self.path(key)}.data"
+        if file_age(path) >= ttl:
+            return None
+
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def set(self, key: str, value: bytes):
+        """Store value for key, just logging if it can not be written."""
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            write_atomic(f"{self.path(key)}.data", value)
+        except OSError as e:
+            logger.warning("Could not store %s in shared cache: %s", key, e)
+
+    def delete(self, key: str):
+        """Remove key, so it is refreshed on next use."""
+        try:
+            os.unlink(f"{self.path(key)}.data")
+        except FileNotFoundError:
+            pass
+
+    def refresh(
+        self, key: str, stale: Optional[bytes], build: Callable[[], bytes]
+    ) -> bytes:
+        """Replace a value found to be stale, unless another process did it.
+
+        Returns the value stored for key once done.
+        """
+        with self.lock(key):
+            value = self.get(key, float("inf"))
+            if value is None or value == stale:
+                value = build()
+                self.set(key, value)
+
+        return value
+
+    def get_or_set(self, key: str, ttl: float, build: Callable[[], bytes]) -> bytes:
+        """Return value for key, building and storing it when expired.
+
+        A single process builds it, others wait and read what it stored.
+        """
+        value = self.get(key, ttl)
+        if value is not None:
+            return value
+
+        with self.lock(key):
+            value = self.get(key, ttl)
+            if value is None:
+                value = build()
+                self.set(key, value)
+
+        return value
@@ -0,0 +1,195 @@
+"""Module for fetching Google Sheets published as CSV."""
+
+import codecs
+import csv
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from functools import cache
+from typing import TYPE_CHECKING, BinaryIO, Iterable, Iterator, Optional
+
+from src.settings import logger
+from src.shared_cache import cache_dir, cache_ttl, file_age, file_lock, write_atomic
+from src.transport import mount
+
+CHUNK_SIZE = 64 * 1024  # in bytes
+POOL_SIZE = 8  # Connections kept alive per host
+SHEETS_TTL = 300  # in seconds, fresher bodies are used without asking the server
+TIMEOUT = 60  # in seconds
+
+if TYPE_CHECKING:
+    import requests
+
+
+# pylint: disable=too-few-public-methods
+@cache
+class Sheets:
+    """Fetch published sheets keeping a conditional-GET cache on disk.
+
+    Every sheet body is stored together with its ETag and Last-Modified
+    validators, so refreshing an untouched sheet costs a 304 response
+    and no download.
+
+    Rows are streamed: the body is decoded incrementally and each row is
+    handed over as soon as it is parsed, so a sheet is never held in memory.
+
+    All the tabs of a spreadsheet are served from the same host, so
+    requests go through a single pooled session and reuse warm connections.
+
+    The cache is shared by every process on the host. Bodies fetched less
+    than ttl seconds ago are used as they are, and expired ones are
+    revalidated by a single process while the others wait for it.
+    """
+
+    def __init__(self):
+        """Initialize the sheets cache."""
+        self.cache_dir = cache_dir("sheets")
+        self.ttl = cache_ttl("sheets", SHEETS_TTL)
+        self._session: Optional["requests.Session"] = None
+        self._lock = threading.Lock()
+
+    @property
+    def session(self) -> "requests.Session":
+        """Pooled HTTP session, created on first download.
+
+        requests is only imported here, so reading sheets from
+        the cache does not pay for it.
+        """
+        with self._lock:
+            if self._session is None:
+                # pylint: disable=import-outside-toplevel
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                # pylint: enable=import-outside-toplevel
+
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE
+                )
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                self._session = mount(session, "sheets")
+
+            return self._session
+
+    def read_csv(self, url: str) -> Iterator[dict[str, str]]:
+        """Fetch URL and yield CSV rows."""
+        path = self._path(url)
+        if file_age(f"{path}.csv") < self.ttl:
+            yield from self._cached(url, path)
+            return
+
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+        except OSError:
+            pass  # Reported when locking or storing
+        with file_lock(f"{path}.lock"):
+            if file_age(f"{path}.csv") < self.ttl:
+                # Refreshed by another process while waiting for the lock
+                yield from self._cached(url, path)
+                return
+
+            yield from self._fetch(url, path)
+
+    def _cached(self, url: str, path: str) -> Iterator[dict[str, str]]:
+        """Yield CSV rows of the body stored for URL."""
+        logger.debug("Sheet read from cache %s", url)
+        with open(f"{path}.csv", "rb") as f:
+            yield from _parse(f)
+
+    def _fetch(self, url: str, path: str) -> Iterator[dict[str, str]]:
+        """Revalidate, or download, the body for URL and yield CSV rows."""
+        validators = self._validators(path)
+
+        headers: dict[str, str] = {}
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"] or ""
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"] or ""
+
+        with self.session.get(
+            url, headers=headers, stream=True, timeout=TIMEOUT
+        ) as resp:
+            if resp.status_code == 304:
+                logger.debug("Sheet not modified %s", url)
+                os.utime(f"{path}.csv")  # Fresh for ttl seconds more
+                with open(f"{path}.csv", "rb") as f:
+                    yield from _parse(f)
+                return
+
+            resp.raise_for_status()
+            validators = {
+                "etag": resp.headers.get("ETag"),
+                "last_modified": resp.headers.get("Last-Modified"),
+            }
+            lines = _lines(resp.iter_content(CHUNK_SIZE))
+            yield from self._store(path, lines, validators)
+
+    def _store(
+        self, path: str, lines: Iterable[bytes], validators: dict[str, Optional[str]]
+    ) -> Iterator[dict[str, str]]:
+        """Parse lines while saving them, along with validators, in the cache.
+
+        The cache is only updated once the whole body has been read.
+        """
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir)
+        except OSError as e:
+            logger.warning("Could not store sheet in cache: %s", e)
+            yield from _parse(lines)
+            return
+
+        done = False
+        try:
+            with os.fdopen(fd, "wb") as f:
+                yield from _parse(_tee(lines, f))
+            os.replace(tmp_path, f"{path}.csv")
+            write_atomic(f"{path}.json", json.dumps(validators).encode("utf-8"))
+            done = True
+        finally:
+            if not done and os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+    def _path(self, url: str) -> str:
+        """Path in the cache for a URL, without extension."""
+        key = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, key)
+
+    def _validators(self, path: str) -> dict[str, Optional[str]]:
+        """Return stored validators, empty if the body is not cached."""
+        if not os.path.exists(f"{path}.csv"):
+            return {}
+
+        try:
+            with open(f"{path}.json", "r", encoding="utf8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+
+def _parse(lines: Iterable[bytes]) -> Iterator[dict[str, str]]:
+    """Decode and parse CSV lines one at a time."""
+    yield from csv.DictReader(codecs.iterdecode(lines, "utf-8"))
+
+
+def _lines(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """Split chunks of a body into lines, keeping line endings."""
+    pending = b""
+    for chunk in chunks:
+        *lines, pending = (pending + chunk).split(b"\n")
+        for line in lines:
+            yield line + b"\n"
+
+    if pending:
+        yield pending
+
+
+def _tee(lines: Iterable[bytes], f: BinaryIO) -> Iterator[bytes]:
+    """Yield lines while writing them to a file."""
+    for line in lines:
+        f.write(line)
+        yield line
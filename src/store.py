@@ -0,0 +1,353 @@
+"""Module for the local SQLite copy of league data."""
+
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from functools import cache
+from typing import Any, Iterable, Optional, Sequence
+
+from src.cs.calendar import Calendar
+from src.cs.date import local_date, zone
+from src.cs.duel import Duel
+from src.cs.player import Player
+from src.settings import config
+
+DEFAULT_PATH = os.path.join(".cache", "league.db")
+TIMEOUT = 30  # in seconds, waiting for other processes to release the db
+MAX_VARIABLES = 500  # Parameters per query, well below SQLite limits
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS players (
+    season INTEGER NOT NULL,
+    grp TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    telegram TEXT NOT NULL,
+    PRIMARY KEY (season, grp, position)
+);
+CREATE INDEX IF NOT EXISTS players_by_id ON players (id);
+
+CREATE TABLE IF NOT EXISTS duels (
+    season INTEGER NOT NULL,
+    grp TEXT NOT NULL,
+    sheet TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    p1 INTEGER NOT NULL,
+    p2 INTEGER NOT NULL,
+    day TEXT NOT NULL,
+    planned REAL NOT NULL,
+    scheduled REAL NOT NULL,
+    played_at REAL,
+    p1_score INTEGER,
+    p2_score INTEGER,
+    played INTEGER NOT NULL,
+    played_for_real INTEGER NOT NULL,
+    PRIMARY KEY (season, grp, sheet, position)
+);
+CREATE INDEX IF NOT EXISTS duels_by_day ON duels (season, sheet, day);
+CREATE INDEX IF NOT EXISTS duels_by_p1 ON duels (p1, season);
+CREATE INDEX IF NOT EXISTS duels_by_p2 ON duels (p2, season);
+
+CREATE TABLE IF NOT EXISTS calendar (
+    season INTEGER NOT NULL,
+    grp TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    round INTEGER NOT NULL,
+    start REAL NOT NULL,
+    p1 INTEGER NOT NULL,
+    p2 INTEGER NOT NULL,
+    PRIMARY KEY (season, grp, position)
+);
+
+CREATE TABLE IF NOT EXISTS synced (
+    season INTEGER NOT NULL,
+    grp TEXT NOT NULL,
+    sheet TEXT NOT NULL,
+    synced_at REAL NOT NULL,
+    PRIMARY KEY (season, grp, sheet)
+);
+
+CREATE TABLE IF NOT EXISTS verdicts (
+    key TEXT PRIMARY KEY,
+    ok INTEGER NOT NULL,
+    tables TEXT NOT NULL,
+    checked_at REAL NOT NULL
+);
+"""
+
+
+class Store:
+    """Keep players, calendar, schedule and outcome of every group in SQLite.
+
+    Groups are saved every time they are built from the sheets, so a new
+    process can load the league from disk and refresh it in the background.
+
+    Duels are saved along with their local date, so questions about a day
+    or a player are answered from the indexes without loading any group.
+
+    One connection is opened per thread, sqlite3 connections can not be
+    shared between threads. Use open_store() to share stores by path.
+    """
+
+    def __init__(self, path: str = DEFAULT_PATH):
+        """Open, or create, the store at path."""
+        self.path = path
+        self._local = threading.local()
+
+    def _db(self) -> sqlite3.Connection:
+        """Return the connection for the current thread."""
+        db: Optional[sqlite3.Connection] = getattr(self._local, "db", None)
+        if db is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            db = sqlite3.connect(self.path, timeout=TIMEOUT)
+            db.row_factory = sqlite3.Row
+            db.executescript(SCHEMA)
+            self._local.db = db
+
+        return db
+
+    def synced(self, season: int, group: str) -> dict[str, float]:
+        """Return when each sheet of a group was last saved, keyed by sheet."""
+        rows = self._db().execute(
+            "SELECT sheet, synced_at FROM synced WHERE season = ? AND grp = ?",
+            (season, group),
+        )
+        return {row["sheet"]: row["synced_at"] for row in rows}
+
+    def save_players(self, season: int, group: str, players: Sequence[Player]):
+        """Replace the players of a group."""
+        with self._db() as db:
+            db.execute(
+                "DELETE FROM players WHERE season = ? AND grp = ?", (season, group)
+            )
+            db.executemany(
+                "INSERT INTO players VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    (season, group, position, p.id, p.name, p.telegram)
+                    for position, p in enumerate(players)
+                ),
+            )
+            _mark_synced(db, season, group, "players")
+
+    def load_players(self, season: int, group: str) -> list[Player]:
+        """Return the players of a group, in sheet order."""
+        rows = self._db().execute(
+            "SELECT id, name, telegram FROM players"
+            " WHERE season = ? AND grp = ? ORDER BY position",
+            (season, group),
+        )
+        return [Player(row["id"], row["name"], row["telegram"]) for row in rows]
+
+    def save_calendar(self, season: int, group: str, calendar: Optional[Calendar]):
+        """Replace the calendar of a group."""
+        entries = calendar.entries() if calendar else iter(())
+        with self._db() as db:
+            db.execute(
+                "DELETE FROM calendar WHERE season = ? AND grp = ?", (season, group)
+            )
+            db.executemany(
+                "INSERT INTO calendar VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    (season, group, position, r, start.timestamp(), p1.id, p2.id)
+                    for position, (r, start, p1, p2) in enumerate(entries)
+                ),
+            )
+            _mark_synced(db, season, group, "calendar")
+
+    def load_calendar(
+        self, season: int, group: str, players: Iterable[Player]
+    ) -> Optional[Calendar]:
+        """Return the calendar of a group, None if it has none."""
+        players_by_id = {player.id: player for player in players}
+        rows = (
+            self._db()
+            .execute(
+                "SELECT round, start, p1, p2 FROM calendar"
+                " WHERE season = ? AND grp = ? ORDER BY position",
+                (season, group),
+            )
+            .fetchall()
+        )
+        if not rows:
+            return None
+
+        calendar = Calendar()
+        for row in rows:
+            calendar.add(
+                player_1=players_by_id[row["p1"]],
+                player_2=players_by_id[row["p2"]],
+                duel_round=row["round"],
+                start=_datetime(row["start"]),
+            )
+
+        return calendar
+
+    def save_duels(
+        self, season: int, group: str, sheet: str, duels: Sequence[Duel], start: int = 0
+    ):
+        """Replace the duels of a sheet from position start on.
+
+        Duels before start are left untouched, so appending
+        new results does not rewrite the ones already saved.
+        """
+        with self._db() as db:
+            db.execute(
+                "DELETE FROM duels"
+                " WHERE season = ? AND grp = ? AND sheet = ? AND position >= ?",
+                (season, group, sheet, start),
+            )
+            db.executemany(
+                "INSERT INTO duels VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    _duel_row(season, group, sheet, position, duels[position])
+                    for position in range(start, len(duels))
+                ),
+            )
+            _mark_synced(db, season, group, sheet)
+
+    def load_duels(
+        self, season: int, group: str, sheet: str, players: Iterable[Player]
+    ) -> list[Duel]:
+        """Return the duels of a sheet, in sheet order."""
+        players_by_id = {player.id: player for player in players}
+        rows = self._db().execute(
+            "SELECT * FROM duels"
+            " WHERE season = ? AND grp = ? AND sheet = ? ORDER BY position",
+            (season, group, sheet),
+        )
+        return [
+            Duel(
+                p1=players_by_id[row["p1"]],
+                p2=players_by_id[row["p2"]],
+                planned=_datetime(row["planned"]),
+                schedule_timestamp=_datetime(row["scheduled"]),
+                outcome_timestamp=(
+                    None if row["played_at"] is None else _datetime(row["played_at"])
+                ),
+                p1_score=row["p1_score"],
+                p2_score=row["p2_score"],
+                played=bool(row["played"]),
+                played_for_real=bool(row["played_for_real"]),
+            )
+            for row in rows
+        ]
+
+    def player_duels(
+        self, player_id: int, season: Optional[int] = None
+    ) -> list[sqlite3.Row]:
+        """Return played duels of a player, in every season or just one.
+
+        Rows hold season, grp, day, p1, p2, p1_score and p2_score, by date.
+        """
+        query = (
+            "SELECT season, grp, day, p1, p2, p1_score, p2_score FROM duels"
+            " WHERE {} = ? AND sheet = 'results'"
+        )
+        params: tuple[Any, ...] = (player_id,)
+        if season is not None:
+            query += " AND season = ?"
+            params += (season,)
+        query = f"{query.format('p1')} UNION ALL {query.format('p2')} ORDER BY day"
+
+        return self._db().execute(query, params + params).fetchall()
+
+    def load_verdicts(self, keys: Sequence[str]) -> dict[str, bool]:
+        """Return stored BGA verdicts of duels, keyed by duel key.
+
+        Duels never checked are not in the result.
+        """
+        verdicts: dict[str, bool] = {}
+        db = self._db()
+        for i in range(0, len(keys), MAX_VARIABLES):
+            chunk = keys[i : i + MAX_VARIABLES]
+            rows = db.execute(
+                "SELECT key, ok FROM verdicts"
+                f" WHERE key IN ({', '.join('?' * len(chunk))})",
+                chunk,
+            )
+            verdicts.update((row["key"], bool(row["ok"])) for row in rows)
+
+        return verdicts
+
+    def save_verdicts(self, verdicts: Iterable[tuple[str, bool, str]]):
+        """Store BGA verdicts as (duel key, ok, tables as JSON) tuples."""
+        now = time.time()
+        with self._db() as db:
+            db.executemany(
+                "INSERT OR REPLACE INTO verdicts VALUES (?, ?, ?, ?)",
+                ((key, int(ok), tables, now) for key, ok, tables in verdicts),
+            )
+
+
+# pylint: disable=too-many-arguments,too-many-positional-arguments
+def _duel_row(
+    season: int, group: str, sheet: str, position: int, duel: Duel
+) -> tuple[Any, ...]:
+    """Return the values saved for a duel."""
+    played_at = duel.outcome_timestamp
+    day = local_date(played_at if sheet == "results" and played_at else duel.planned)
+
+    return (
+        season,
+        group,
+        sheet,
+        position,
+        duel.p1.id,
+        duel.p2.id,
+        day.isoformat(),
+        duel.planned.timestamp(),
+        duel.schedule_timestamp.timestamp(),
+        played_at.timestamp() if played_at else None,
+        duel.p1_score,
+        duel.p2_score,
+        int(duel.played),
+        int(duel.played_for_real),
+    )
+
+
+# pylint: enable=too-many-arguments,too-many-positional-arguments
+
+
+def _mark_synced(db: sqlite3.Connection, season: int, group: str, sheet: str):
+    """Record that a sheet of a group was just saved."""
+    db.execute(
+        "INSERT OR REPLACE INTO synced VALUES (?, ?, ?, ?)",
+        (season, group, sheet, time.time()),
+    )
+
+
+def _datetime(timestamp: float) -> datetime:
+    """Return UTC datetime for a timestamp."""
+    return datetime.fromtimestamp(timestamp, zone("UTC"))
+
+
+@cache
+def open_store(path: str = DEFAULT_PATH) -> Store:
+    """Return the store at path, a single one per path."""
+    return Store(path)
+
+
+def league_store() -> Optional[Store]:
+    """Return the configured store, None if it is disabled."""
+    cnf = config.get("store", {})
+    if not cnf.get("enabled", False):
+        return None
+
+    return open_store(cnf.get("path", DEFAULT_PATH))
+
+
+def verdict_store() -> Optional[Store]:
+    """Return the store keeping BGA verdicts, None if they are not kept.
+
+    Verdicts are kept in the league store file, even when league data
+    is not, as checking them again takes requests to BGA.
+    """
+    if not config["bga"].get("keep_verdicts", True):
+        return None
+
+    return open_store(config.get("store", {}).get("path", DEFAULT_PATH))
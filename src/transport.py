@@ -0,0 +1,383 @@
+"""Module for recording and replaying exchanges with external services.
+
+Every HTTP request to the sheets, BGA, Telegram, Twitter and Google Calendar
+goes through the transport configured in transport.mode:
+
+    live    Requests go to the services, as usual.
+    record  Same, and every exchange is saved in a cassette, a JSON file
+            per service in transport.cassettes.
+    replay  Requests are answered from the cassettes, after waiting for
+            transport.latency seconds, without using the network.
+
+Exchanges are matched by method, URL and body. A request sent several
+times gets the recorded responses in order, the last one once they run out.
+
+Credentials are kept out of cassettes: the Telegram token in URLs, login
+form fields in bodies, and cookies set by responses are never recorded.
+"""
+
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+from functools import cache
+from typing import TYPE_CHECKING, Any, Iterable, Optional
+from urllib.parse import parse_qsl, urlencode
+
+from src.settings import config, logger
+from src.shared_cache import write_atomic
+
+if TYPE_CHECKING:
+    import requests
+    import telegram.request
+
+LIVE = "live"
+RECORD = "record"
+REPLAY = "replay"
+DEFAULT_CASSETTES = os.path.join(".cache", "cassettes")
+
+# Headers describing the body as sent, not as it is recorded
+DECODED_HEADERS = ("content-encoding", "content-length", "transfer-encoding")
+# Response headers holding session secrets, never recorded
+SECRET_HEADERS = ("set-cookie",)
+# Form fields holding credentials, redacted before requests are keyed
+CREDENTIAL_FIELDS = ("email", "password", "passwd", "user", "username")
+REDACTED = "REDACTED"
+
+Exchange = dict[str, Any]
+
+
+def transport_mode() -> str:
+    """Return the configured transport mode."""
+    mode = config.get("transport", {}).get("mode", LIVE)
+    if mode not in (LIVE, RECORD, REPLAY):
+        raise ValueError(f"Unknown transport mode {mode}")
+
+    return mode
+
+
+def replay_latency() -> float:
+    """Return seconds replayed requests wait before being answered."""
+    return float(config.get("transport", {}).get("latency", 0))
+
+
+class Cassette:
+    """Exchanges with a service, stored in a JSON file.
+
+    Recorded exchanges are written to disk as they happen, so a run
+    stopped half way still leaves what it did in the cassette.
+    """
+
+    def __init__(self, path: str):
+        """Load the cassette at path, empty if it does not exist."""
+        self.path = path
+        self._lock = threading.Lock()
+        self._played: dict[str, int] = {}
+        try:
+            with open(path, "r", encoding="utf8") as f:
+                self._exchanges: dict[str, list[Exchange]] = json.load(f)
+        except FileNotFoundError:
+            self._exchanges = {}
+
+    def record(self, key: str, status: int, headers: dict[str, str], body: bytes):
+        """Save a response to the request identified by key."""
+        exchange = {
+            "status": status,
+            "headers": headers,
+            "body": base64.b64encode(body).decode("ascii"),
+        }
+        with self._lock:
+            self._exchanges.setdefault(key, []).append(exchange)
+            data = json.dumps(self._exchanges, indent=1).encode("utf-8")
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            write_atomic(self.path, data)
+
+    def play(self, key: str) -> tuple[int, dict[str, str], bytes]:
+        """Return status, headers and body of the next response to key."""
+        with self._lock:
+            exchanges = self._exchanges.get(key)
+            if not exchanges:
+                raise RuntimeError(f"No exchange for {key} in {self.path}")
+            played = self._played.get(key, 0)
+            self._played[key] = played + 1
+
+        exchange = exchanges[min(played, len(exchanges) - 1)]
+        return (
+            exchange["status"],
+            exchange["headers"],
+            base64.b64decode(exchange["body"]),
+        )
+
+
+@cache
+def cassette(name: str) -> Cassette:
+    """Return the cassette of a service, a single one per service."""
+    directory = config.get("transport", {}).get("cassettes", DEFAULT_CASSETTES)
+    return Cassette(os.path.join(directory, f"{name}.json"))
+
+
+def exchange_key(method: str, url: str, body: Optional[bytes] = None) -> str:
+    """Return the key matching a request with its recorded responses.
+
+    Credentials in form bodies are redacted first, so cassettes do not
+    carry a hash of them, and replays match whichever ones are configured.
+    """
+    key = f"{method.upper()} {url}"
+    body = _redacted(body)
+    if body:
+        key += f" {hashlib.sha1(body).hexdigest()}"
+
+    return key
+
+
+def _redacted(body: Optional[bytes]) -> Optional[bytes]:
+    """Return a body with values of credential form fields replaced."""
+    if not body:
+        return body
+
+    try:
+        fields = parse_qsl(
+            body.decode("ascii"), keep_blank_values=True, strict_parsing=True
+        )
+    except ValueError:  # Not a form, UnicodeDecodeError is a ValueError too
+        return body
+
+    if not any(name.lower() in CREDENTIAL_FIELDS for name, _ in fields):
+        return body
+
+    return urlencode(
+        [
+            (name, REDACTED if name.lower() in CREDENTIAL_FIELDS else value)
+            for name, value in fields
+        ]
+    ).encode("ascii")
+
+
+def _recorded_headers(headers: Iterable[tuple[str, str]]) -> dict[str, str]:
+    """Return the response headers saved in cassettes."""
+    return {
+        name: value
+        for name, value in headers
+        if name.lower() not in DECODED_HEADERS + SECRET_HEADERS
+    }
+
+
+def _bytes(body: Any) -> Optional[bytes]:
+    """Return a request body as bytes."""
+    if body is None or isinstance(body, bytes):
+        return body
+    if isinstance(body, str):
+        return body.encode("utf-8")
+
+    return None  # Streamed bodies are not matched
+
+
+def mount(session: "requests.Session", name: str) -> "requests.Session":
+    """Send requests of a session through the configured transport.
+
+    Returns the session, untouched in live mode.
+    """
+    if transport_mode() == LIVE:
+        return session
+
+    adapter = _cassette_adapter()(name, session.get_adapter("https://"))
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+@cache
+def _cassette_adapter() -> type:
+    """Return the requests adapter class, requests is only imported here."""
+    # pylint: disable=import-outside-toplevel
+    import io
+
+    import requests
+    from requests.adapters import BaseAdapter
+    from requests.structures import CaseInsensitiveDict
+
+    # pylint: enable=import-outside-toplevel
+
+    class CassetteAdapter(BaseAdapter):
+        """Record or replay exchanges of a requests session."""
+
+        def __init__(self, name: str, inner: BaseAdapter):
+            """Build an adapter for a service, sending live requests to inner."""
+            super().__init__()
+            self.cassette = cassette(name)
+            self.inner = inner
+
+        # pylint: disable-next=too-many-arguments,too-many-positional-arguments
+        def send(
+            self,
+            request: requests.PreparedRequest,
+            stream: bool = False,
+            timeout: Any = None,
+            verify: Any = True,
+            cert: Any = None,
+            proxies: Any = None,
+        ) -> requests.Response:
+            """Send a request, or answer it from the cassette."""
+            key = exchange_key(
+                request.method or "GET", request.url or "", _bytes(request.body)
+            )
+            if transport_mode() != REPLAY:
+                # Live response is returned, so the session gets its cookies
+                resp = self.inner.send(request, stream, timeout, verify, cert, proxies)
+                headers = _recorded_headers(resp.headers.items())
+                self.cassette.record(key, resp.status_code, headers, resp.content)
+                return resp
+
+            time.sleep(replay_latency())
+            status, headers, body = self.cassette.play(key)
+            resp = requests.Response()
+            resp.status_code = status
+            resp.headers = CaseInsensitiveDict(headers)
+            resp.raw = io.BytesIO(body)
+            resp.url = request.url or ""
+            resp.request = request
+            resp.encoding = requests.utils.get_encoding_from_headers(resp.headers)
+            return resp
+
+        def close(self):
+            """Close the live adapter."""
+            self.inner.close()
+
+    return CassetteAdapter
+
+
+def telegram_request(
+    name: str = "telegram",
+) -> Optional["telegram.request.BaseRequest"]:
+    """Return a Telegram request going through the configured transport.
+
+    None in live mode, so the library uses its default one.
+    """
+    if transport_mode() == LIVE:
+        return None
+
+    return _cassette_request()(name)
+
+
+@cache
+def _cassette_request() -> type:
+    """Return the Telegram request class, telegram is only imported here."""
+    # pylint: disable-next=import-outside-toplevel
+    from telegram.request import BaseRequest, HTTPXRequest, RequestData
+
+    class CassetteRequest(BaseRequest):
+        """Record or replay exchanges with the Telegram Bot API."""
+
+        def __init__(self, name: str):
+            """Build a request for a service, sending live ones through httpx."""
+            self.cassette = cassette(name)
+            self.inner = HTTPXRequest()
+
+        @property
+        def read_timeout(self) -> Optional[float]:
+            """Read timeout of the live request."""
+            return self.inner.read_timeout
+
+        async def initialize(self):
+            """Initialize the live request."""
+            await self.inner.initialize()
+
+        async def shutdown(self):
+            """Shut down the live request."""
+            await self.inner.shutdown()
+
+        # pylint: disable-next=too-many-arguments,too-many-positional-arguments
+        async def do_request(
+            self,
+            url: str,
+            method: str,
+            request_data: Optional[RequestData] = None,
+            read_timeout: Any = BaseRequest.DEFAULT_NONE,
+            write_timeout: Any = BaseRequest.DEFAULT_NONE,
+            connect_timeout: Any = BaseRequest.DEFAULT_NONE,
+            pool_timeout: Any = BaseRequest.DEFAULT_NONE,
+        ) -> tuple[int, bytes]:
+            """Send a request, or answer it from the cassette."""
+            body = None
+            if request_data is not None:
+                body = json.dumps(request_data.json_parameters, sort_keys=True)
+            # Bot token is part of the URL, keep it out of cassettes
+            key = exchange_key(method, url.rsplit("/", 1)[-1], _bytes(body))
+
+            if transport_mode() == REPLAY:
+                await asyncio.sleep(replay_latency())
+                status, _, content = self.cassette.play(key)
+                return status, content
+
+            status, content = await self.inner.do_request(
+                url,
+                method,
+                request_data,
+                read_timeout,
+                write_timeout,
+                connect_timeout,
+                pool_timeout,
+            )
+            self.cassette.record(key, status, {}, content)
+            return status, content
+
+    return CassetteRequest
+
+
+def google_http(name: str, http: Any = None) -> Any:
+    """Return an httplib2 compatible client going through the transport.
+
+    http sends live requests, it is returned as it is in live mode.
+    It is not needed, nor used, when replaying.
+    """
+    if transport_mode() == LIVE:
+        return http
+
+    return CassetteHttp(name, http)
+
+
+# pylint: disable=too-few-public-methods
+class CassetteHttp:
+    """Record or replay exchanges of an httplib2 client."""
+
+    def __init__(self, name: str, inner: Any):
+        """Build a client for a service, sending live requests to inner."""
+        self.cassette = cassette(name)
+        self.inner = inner
+
+    # pylint: disable-next=too-many-arguments,too-many-positional-arguments
+    def request(
+        self,
+        uri: str,
+        method: str = "GET",
+        body: Any = None,
+        headers: Optional[dict[str, str]] = None,
+        redirections: int = 5,
+        connection_type: Any = None,
+    ) -> tuple[Any, bytes]:
+        """Send a request, or answer it from the cassette."""
+        import httplib2  # pylint: disable=import-outside-toplevel
+
+        key = exchange_key(method, uri, _bytes(body))
+        if transport_mode() == REPLAY:
+            time.sleep(replay_latency())
+            status, resp_headers, content = self.cassette.play(key)
+            return httplib2.Response({**resp_headers, "status": status}), content
+
+        if self.inner is None:
+            raise RuntimeError(f"No client to record {key}")
+
+        resp, content = self.inner.request(
+            uri, method, body, headers, redirections, connection_type
+        )
+        logger.debug("Recorded %s", key)
+        self.cassette.record(key, resp.status, _recorded_headers(resp.items()), content)
+        return resp, content
+
+
+# pylint: enable=too-few-public-methods
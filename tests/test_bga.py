@@ -0,0 +1,243 @@
+"""Test BGA outcome checks."""
+
+import json
+import tempfile
+import unittest
+from typing import Any
+from unittest.mock import PropertyMock, patch
+from urllib.parse import parse_qs, urlparse
+
+from src.bga import BGA, PAGE_SIZE, _plan_history
+from src.cs.date import utc_datetime
+from src.cs.duel import Duel
+from src.cs.player import Player
+from src.shared_cache import SharedCache
+from src.store import Store
+
+ALICE = Player(1, "alice")
+BOB = Player(2, "bob")
+CAROL = Player(3, "carol")
+
+# Games played: table id, players, start and winner
+GAMES = [
+    (10, ALICE, BOB, "2022-11-01 21:00:00", ALICE),
+    (11, ALICE, BOB, "2022-11-01 21:40:00", ALICE),
+    (12, CAROL, ALICE, "2022-11-02 20:00:00", CAROL),
+    (13, CAROL, ALICE, "2022-11-02 20:40:00", ALICE),
+    (14, CAROL, ALICE, "2022-11-02 21:20:00", CAROL),
+    (15, BOB, CAROL, "2022-11-02 22:00:00", BOB),
+    (16, BOB, CAROL, "2022-11-02 22:40:00", BOB),
+]
+
+
+# pylint: disable=too-few-public-methods
+class _Response:
+    """Response holding tables."""
+
+    status_code = 200
+
+    def __init__(self, tables: list[dict[str, Any]], status: str = "1"):
+        """Build a response."""
+        self.tables = tables
+        self.status = status
+
+    def json(self) -> dict[str, Any]:
+        """Return body like getGames does."""
+        if self.status == "0":
+            return {"status": "0", "error": "You must be logged in"}
+        return {"status": self.status, "data": {"tables": self.tables}}
+
+
+class _Session:
+    """Answer getGames queries from GAMES, recording them."""
+
+    # Request tokens BGA accepts
+    valid = {"token"}
+    # Tables per page, when a page is asked for
+    page_size = PAGE_SIZE
+
+    def __init__(self, token: str = "token"):
+        """Build a session."""
+        self.token = token
+        self.urls: list[str] = []
+
+    def get(self, url: str) -> _Response:
+        """Return games of a player, against an opponent if given."""
+        self.urls.append(url)
+        if self.token not in self.valid:
+            return _Response([], status="0")
+
+        query = {key: value[0] for key, value in parse_qs(urlparse(url).query).items()}
+        player = int(query["player"])
+        opponent = int(query.get("opponent_id", 0))
+
+        tables: list[dict[str, Any]] = []
+        for table_id, p1, p2, start, winner in GAMES:
+            ids = (p1.id, p2.id)
+            timestamp = utc_datetime(start).timestamp()
+            if player not in ids or (opponent and opponent not in ids):
+                continue
+            if not int(query["start_date"]) <= timestamp <= int(query["end_date"]):
+                continue
+
+            tables.append(
+                {
+                    "table_id": str(table_id),
+                    "players": f"{p1.id},{p2.id}",
+                    "player_names": f"{p1.name},{p2.name}",
+                    "ranks": "1,2" if winner is p1 else "2,1",
+                    "start": str(int(timestamp)),
+                    "elo_win": "10" if winner.id == player else "-10",
+                    "arena_win": None,
+                    "unranked": "0",
+                }
+            )
+
+        if "page" in query:
+            start = (int(query["page"]) - 1) * self.page_size
+            tables = tables[start : start + self.page_size]
+
+        return _Response(tables)
+
+
+# pylint: enable=too-few-public-methods
+
+
+def _duel(p1: Player, p2: Player, played: str, p1_score: int, p2_score: int) -> Duel:
+    """Build a duel played for real."""
+    when = utc_datetime(played)
+    return Duel(p1, p2, when, when, when, p1_score, p2_score, True, True)
+
+
+class TestBGA(unittest.TestCase):
+    """Test BGA outcome checks."""
+
+    def test_check_duels(self):
+        """Check batched checks match single checks with fewer queries."""
+        duels = [
+            _duel(ALICE, BOB, "2022-11-01 22:30:00", 2, 0),
+            _duel(ALICE, CAROL, "2022-11-02 21:50:00", 1, 2),
+            _duel(CAROL, BOB, "2022-11-02 23:10:00", 2, 0),  # Wrong, Bob won
+        ]
+
+        single = _Session()
+        batched = _Session()
+        with patch("src.rate_limit.time.sleep"), patch(
+            "src.bga.verdict_store", return_value=None
+        ):
+            bga = BGA()
+            with patch.object(
+                type(bga), "session", new_callable=PropertyMock
+            ) as session:
+                session.return_value = single
+                single_checks = [bga.check_duel(duel) for duel in duels]
+                session.return_value = batched
+                batched_checks = bga.check_duels(duels)
+
+        self.assertEqual(single_checks, [True, True, False])
+        self.assertEqual(batched_checks, single_checks)
+        self.assertEqual(len(single.urls), len(duels))
+        # Two histories, fitting a page each
+        self.assertEqual(len(batched.urls), 2)
+
+    def test_paged_history(self):
+        """Check every page of a history is used, or duels checked one by one."""
+        duels = [
+            _duel(ALICE, BOB, "2022-11-01 22:30:00", 2, 0),
+            _duel(ALICE, CAROL, "2022-11-02 21:50:00", 1, 2),
+            _duel(CAROL, BOB, "2022-11-02 23:10:00", 2, 0),  # Wrong, Bob won
+        ]
+
+        for max_pages, one_by_one in ((10, False), (2, True)):
+            with self.subTest(max_pages=max_pages):
+                session = _Session()
+                bga = BGA()
+                with patch("src.rate_limit.time.sleep"), patch(
+                    "src.bga.verdict_store", return_value=None
+                ), patch("src.bga.MAX_PAGES", max_pages), patch(
+                    "src.bga.PAGE_SIZE", 1
+                ), patch.object(
+                    _Session, "page_size", 1
+                ), patch.object(
+                    type(bga),
+                    "session",
+                    new_callable=PropertyMock,
+                    return_value=session,
+                ):
+                    self.assertEqual(bga.check_duels(duels), [True, True, False])
+
+                pairs = [url for url in session.urls if "opponent_id" in url]
+                self.assertEqual(bool(pairs), one_by_one)
+
+    def test_verdicts(self):
+        """Check only duels not found right before are checked again."""
+        duels = [
+            _duel(ALICE, BOB, "2022-11-01 22:30:00", 2, 0),
+            _duel(CAROL, BOB, "2022-11-02 23:10:00", 2, 0),  # Wrong, Bob won
+        ]
+
+        bga = BGA()
+        with tempfile.TemporaryDirectory() as tmp, patch(
+            "src.rate_limit.time.sleep"
+        ), patch(
+            "src.bga.verdict_store", return_value=Store(f"{tmp}/league.db")
+        ), patch.object(
+            type(bga), "session", new_callable=PropertyMock, return_value=_Session()
+        ), patch(
+            "src.bga._plan_history", wraps=_plan_history
+        ) as plan:
+
+            def _checked(recheck: bool = False) -> list[Duel]:
+                self.assertEqual(bga.check_duels(duels, recheck), [True, False])
+                return list(plan.call_args.args[0])
+
+            with self.subTest(i="first run"):
+                self.assertEqual(_checked(), duels)
+
+            with self.subTest(i="right duel skipped"):
+                self.assertEqual(_checked(), duels[1:])
+
+            with self.subTest(i="edited duel checked again"):
+                duels[0].outcome_timestamp = utc_datetime("2022-11-01 22:35:00")
+                self.assertEqual(_checked(), duels)
+
+            with self.subTest(i="recheck"):
+                self.assertEqual(_checked(recheck=True), duels)
+
+    def test_relogin(self):
+        """Check sessions are reused until rejected, then logged in again."""
+        logins: list[str] = []
+
+        def _login() -> bytes:
+            logins.append(f"token{len(logins) + 1}")
+            return json.dumps({"cookies": [], "token": logins[-1]}).encode("utf-8")
+
+        def _session(state: bytes) -> _Session:
+            return _Session(json.loads(state)["token"])
+
+        duel = _duel(ALICE, BOB, "2022-11-01 22:30:00", 2, 0)
+        bga = BGA()
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = SharedCache("bga")
+            cache.directory = tmp
+            cache.set("session", json.dumps({"cookies": [], "token": "old"}).encode())
+
+            with patch.multiple(
+                bga, _cache=cache, _session=None, _state=None, _login=_login
+            ), patch("src.bga._session", _session), patch.object(
+                _Session, "valid", {"token1"}
+            ), patch(
+                "src.rate_limit.time.sleep"
+            ):
+                with self.subTest(i="stored session rejected by probe"):
+                    self.assertTrue(bga.check_duel(duel))
+                    self.assertEqual(logins, ["token1"])
+
+                with self.subTest(i="session rejected by request"):
+                    _Session.valid = {"token2"}
+                    self.assertTrue(bga.check_duel(duel))
+                    self.assertEqual(logins, ["token1", "token2"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,14 +1,19 @@
 """Test Carcassonne Spain classes."""
 
+import threading
+import time
 import unittest
+from collections import OrderedDict
 from datetime import date
 from unittest.mock import patch
 
-from src.cs.date import utc_datetime
+from src.cs.date import parse_column, utc_datetime
 from src.cs.duel import Duel
-from src.cs.group import Group
-from src.cs.league import League
+from src.cs.duel_table import DuelTable
+from src.cs.group import CACHE_TTL, RETRY_TTL, Group
+from src.cs.league import League, LeagueRegistry
 from src.cs.player import Player
+from src.settings import config
 from tests.utils.mock import read_csv
 
 
@@ -97,6 +102,233 @@ class TestCS(unittest.TestCase):
             got = league.group("Rojo").duels(mydate, force_schedule=True)
             self.assertEqual(got, expected)
 
+    def test_duels_between(self):
+        """Check a date range returns the duels of each day in order."""
+        group = League(season=2).group("Azul")
+        start = date.fromisoformat("2022-11-14")
+        end = date.fromisoformat("2022-11-15")
+
+        got = group.duels_between(start, end)
+        expected = group.duels(start) + group.duels(end)
+        self.assertEqual(got, expected)
+        self.assertEqual(len(got), 8)
+
+    def test_parse_column(self):
+        """Check dates in a column are parsed even if the format changes."""
+        values = ["01/11/2022 22:26:50", "01/11/2022 22:34:04", "2022-11-01 22:00:00"]
+        got = list(parse_column(values))
+        expected = [utc_datetime(value) for value in values]
+
+        self.assertEqual(got, expected)
+        self.assertEqual(got[0].isoformat(), "2022-11-01T21:26:50+00:00")
+        self.assertEqual(got[2].isoformat(), "2022-11-01T21:00:00+00:00")
+
+    def test_find_player(self):
+        """Check players are found by name ignoring case."""
+        group = League(season=2).group("Élite")
+
+        # pylint: disable=protected-access
+        self.assertEqual(group._find_player("iqiub"), Player(88929304, "IQIUB"))
+        with self.assertRaises(LookupError):
+            group._find_player("nobody")
+        # pylint: enable=protected-access
+
+    def test_player_index(self):
+        """Check players are found despite typos, along with their duels."""
+        league = League(season=2)
+        index = league.player_index
+        alesiv = Player(88229201, "alesiv")
+
+        with self.subTest(i="search"):
+            self.assertEqual(index.search("ALESIV"), [alesiv])
+            self.assertEqual(index.search("carq"), [Player(89754915, "Carquinyolis")])
+            self.assertEqual(index.search("Alfamr"), [Player(86272013, "Alfamar")])
+            self.assertEqual(
+                index.search("ma"),
+                [Player(85173793, "MadCan"), Player(85058291, "Manel_m_l")],
+            )
+            self.assertEqual(index.search("zzz"), [])
+
+        with self.subTest(i="duels"):
+            group = league.group("Élite")
+            since = date.fromisoformat("2022-11-01")
+            self.assertEqual(index.groups[alesiv.id], "Élite")
+            self.assertEqual(
+                index.played(alesiv.id),
+                [d for d in group.outcome if alesiv in (d.p1, d.p2)],
+            )
+            self.assertEqual(
+                index.upcoming(alesiv.id, since),
+                [
+                    d
+                    for d in group.duels_between(since, date.max, True)
+                    if alesiv in (d.p1, d.p2)
+                ],
+            )
+
+        with self.subTest(i="rebuilt when data changes"):
+            self.assertIs(league.player_index, index)
+            league.group("Rojo").invalidate()
+            self.assertIsNot(league.player_index, index)
+
+    def test_outcome_incremental(self):
+        """Check refreshing outcome only parses new or edited results."""
+        cnf = League(season=2).group("Rojo").config
+        group = Group("Rojo", cnf)
+        results = read_csv(group, cnf["results"])
+        sheet = {"rows": results[:-10]}
+
+        def _read_csv(grp: Group, url: str) -> list[dict[str, str]]:
+            if url == cnf["results"]:
+                return sheet["rows"]
+            return read_csv(grp, url)
+
+        def _refresh() -> list[Duel]:
+            group.invalidate()
+            return list(group.outcome)
+
+        with patch.object(Group, "_read_csv", _read_csv):
+            before = _refresh()
+
+            with self.subTest(i="append"):
+                sheet["rows"] = results
+                got = _refresh()
+                self.assertEqual(len(got), len(before) + 10)
+                self.assertTrue(all(a is b for a, b in zip(before, got)))
+
+            with self.subTest(i="edit"):
+                before = got
+                sheet["rows"] = [dict(row) for row in results]
+                sheet["rows"][5]["score1"] = "0"
+                got = _refresh()
+                self.assertTrue(all(a is b for a, b in zip(before[:5], got)))
+                self.assertIsNot(got[5], before[5])
+                self.assertEqual(got[5].p1_score, 0)
+                self.assertEqual(got[6:], before[6:])
+
+            with self.subTest(i="readers keep what they got"):
+                outcome = group.outcome
+                snapshot = list(outcome)
+                # pylint: disable-next=protected-access
+                by_date = group._outcome_by_date
+                days = by_date.between(date.min, date.max)
+                for rows in (results[:-10], results):
+                    sheet["rows"] = rows
+                    _refresh()
+                self.assertEqual(list(outcome), snapshot)
+                self.assertEqual(by_date.between(date.min, date.max), days)
+
+    def test_compact_duels(self):
+        """Check duels kept in column arrays match duels kept as objects."""
+        group = League(season=2).group("Rojo")
+        with patch.dict(config, {"compact_duels": True}):
+            compact_group = Group("Rojo", group.config)
+
+        mydate = date.fromisoformat("2022-11-01")
+        self.assertIsInstance(compact_group.outcome, DuelTable)
+        self.assertEqual(list(compact_group.outcome), list(group.outcome))
+        self.assertEqual(list(compact_group.schedule), list(group.schedule))
+        self.assertEqual(compact_group.duels(mydate), group.duels(mydate))
+        self.assertEqual(
+            compact_group.duels(mydate, force_schedule=True),
+            group.duels(mydate, force_schedule=True),
+        )
+
+    def test_prefetch(self):
+        """Check prefetch downloads every sheet of every group."""
+        league = League(season=2)
+        timings = league.prefetch()
+
+        expected = sorted(
+            f"{group}/{sheet}"
+            for group in ["Azul", "Rojo", "Verde", "Élite"]
+            for sheet in ["players", "results", "schedule"]
+        )
+        self.assertEqual(sorted(timings), expected)
+        self.assertEqual(len(league.group("Azul").players), 18)
+
+    def test_registry(self):
+        """Check seasons are loaded once and least recently used ones unloaded."""
+        registry = LeagueRegistry()
+        with patch.object(League, "_prefetch", return_value={}), patch.multiple(
+            registry, max_seasons=2, _leagues=OrderedDict()
+        ):
+            leagues = registry.load([2, 3])
+            self.assertEqual([league.season for league in leagues], [2, 3])
+            self.assertIs(registry.league(2), leagues[0])
+
+            registry.league(4)
+            self.assertEqual(registry.loaded, [2, 4])
+            self.assertEqual(registry.league(2).group("Azul").name, "Azul")
+            with self.assertRaises(LookupError):
+                registry.league(2).group("Segunda")
+
+        with self.assertRaises(ValueError):
+            registry.league(99)
+
+    def test_stale_while_revalidate(self):
+        """Check expired data is served while a single revalidation fetches it."""
+        league = League(season=2)
+        group = league.group("Rojo")
+        players = group.players
+        version = group.version
+
+        fetching = threading.Event()
+        fetched: list[str] = []
+
+        def _read_csv(_: Group, url: str) -> list[dict[str, str]]:
+            fetching.wait(5)  # Like a slow download
+            fetched.append(url)
+            return read_csv(_, url)
+
+        self.assertEqual(league.revalidate(margin=0), [])
+
+        expired = time.monotonic() + CACHE_TTL + 1
+        with patch("src.cs.group.time.monotonic", return_value=expired), patch.object(
+            Group, "_read_csv", _read_csv
+        ):
+            for _ in range(3):
+                self.assertIs(group.players, players)
+                self.assertEqual(group.version, version)
+
+            self.assertFalse(group.revalidate())  # Already running
+            fetching.set()
+            for _ in range(500):
+                if group.version != version:
+                    break
+                time.sleep(0.01)
+
+            self.assertNotEqual(group.version, version)
+            # Each sheet read to refresh the sheets cache, then streamed from it
+            self.assertEqual(len(fetched), 2 * len(group.sheets))
+            self.assertEqual(group.players, players)
+            self.assertAlmostEqual(group.expires_in(), CACHE_TTL)
+
+        # Rojo was revalidated in the future, the rest are due
+        due = league.revalidate(margin=CACHE_TTL + 1)
+        self.assertEqual(due, [g for g in league.groups if g is not group])
+
+    def test_revalidate_bad_row(self):
+        """Check stale data is kept, and not revalidated again soon, if a row fails."""
+        group = League(season=2).group("Rojo")
+        schedule = group.schedule
+        version = group.version
+
+        def _read_csv(grp: Group, url: str) -> list[dict[str, str]]:
+            rows = read_csv(grp, url)
+            if url == grp.config["schedule"]:
+                rows[0] = dict(rows[0], player1="nobody")
+            return rows
+
+        expired = time.monotonic() + CACHE_TTL + 1
+        with patch("src.cs.group.time.monotonic", return_value=expired), patch.object(
+            Group, "_read_csv", _read_csv
+        ):
+            self.assertTrue(group.revalidate())
+            self.assertIs(group.schedule, schedule)
+            self.assertEqual(group.version, version)
+            self.assertAlmostEqual(group.expires_in(), RETRY_TTL)
+
 
 if __name__ == "__main__":
     unittest.main()
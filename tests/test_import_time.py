@@ -0,0 +1,60 @@
+"""Test modules used by the bin/ scripts start fast."""
+
+import subprocess
+import sys
+import unittest
+
+# Modules used by the bin/ scripts on their way to the --test paths
+ENTRY_POINTS = [
+    "src.cs.league",
+    "src.io.telegram_cs",
+    "src.io.twitter",
+    "src.io.google_calendar",
+]
+
+# Third party modules only loaded on the code paths that use them
+LAZY = ["requests", "telegram", "tweepy", "googleapiclient", "google.oauth2"]
+
+# Budget for importing all the entry points, in seconds. Several times
+# what it takes, still a fraction of what it took with eager imports.
+BUDGET = 0.5
+
+
+def _import_times(modules: list[str]) -> dict[str, int]:
+    """Import modules in a new interpreter, return cumulative microseconds."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {', '.join(modules)}"],
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+
+    times: dict[str, int] = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        times[name.strip()] = int(cumulative)
+
+    return times
+
+
+class TestImportTime(unittest.TestCase):
+    """Test modules used by the bin/ scripts start fast."""
+
+    def test_lazy_imports(self):
+        """Check heavy third party modules are not imported up front."""
+        times = _import_times(ENTRY_POINTS)
+        for module in LAZY:
+            with self.subTest(module=module):
+                self.assertNotIn(module, times)
+
+    def test_budget(self):
+        """Check importing the entry points stays within budget."""
+        times = _import_times(ENTRY_POINTS)
+        total = sum(times[module] for module in ENTRY_POINTS if module in times)
+        self.assertLess(total / 1e6, BUDGET)
+
+
+if __name__ == "__main__":
+    unittest.main()
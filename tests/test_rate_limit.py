@@ -0,0 +1,45 @@
+"""Test request rate limiting."""
+
+import asyncio
+import threading
+import time
+import unittest
+
+from src.rate_limit import TokenBucket
+
+
+class TestTokenBucket(unittest.TestCase):
+    """Test request rate limiting."""
+
+    def test_rate_shared_by_threads(self):
+        """Check callers from several threads share the same rate."""
+        bucket = TokenBucket(rate=50)
+        start = time.monotonic()
+        threads = [threading.Thread(target=bucket.acquire) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # First one goes through, each of the rest waits 1/50 seconds more
+        self.assertGreaterEqual(time.monotonic() - start, 5 / 50)
+
+    def test_rate_shared_by_coroutines(self):
+        """Check coroutines wait for tokens without blocking each other."""
+        bucket = TokenBucket(rate=50)
+
+        async def _acquire() -> list[float]:
+            return await asyncio.gather(*(bucket.acquire_async() for _ in range(6)))
+
+        waits = asyncio.run(_acquire())
+        self.assertEqual(waits[0], 0)
+        self.assertAlmostEqual(max(waits), 5 / 50, delta=0.01)
+
+    def test_no_rate(self):
+        """Check a bucket without rate never waits."""
+        bucket = TokenBucket(rate=0)
+        self.assertEqual(sum(bucket.acquire() for _ in range(100)), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
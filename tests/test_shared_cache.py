@@ -0,0 +1,62 @@
+"""Test the cache shared between processes."""
+
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from src.shared_cache import SharedCache
+
+
+class TestSharedCache(unittest.TestCase):
+    """Test the cache shared between processes."""
+
+    def setUp(self):
+        """Use an empty cache."""
+        self.tmp = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.cache = SharedCache("test")
+        self.cache.directory = self.tmp.name
+
+    def tearDown(self):
+        """Remove the cache."""
+        self.tmp.cleanup()
+
+    def test_single_writer(self):
+        """Check concurrent readers of an expired key build it only once."""
+        builds: list[int] = []
+
+        def _build() -> bytes:
+            builds.append(1)
+            time.sleep(0.05)
+            return b"value"
+
+        got: list[bytes] = []
+        threads = [
+            threading.Thread(
+                target=lambda: got.append(self.cache.get_or_set("key", 60, _build))
+            )
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(got, [b"value"] * 4)
+        self.assertEqual(len(builds), 1)
+
+    def test_ttl(self):
+        """Check keys older than their TTL are built again."""
+        self.cache.set("key", b"old")
+        self.assertEqual(self.cache.get("key", 60), b"old")
+
+        with patch("src.shared_cache.time.time", return_value=time.time() + 61):
+            self.assertIsNone(self.cache.get("key", 60))
+            got = self.cache.get_or_set("key", 60, lambda: b"new")
+
+        self.assertEqual(got, b"new")
+
+
+if __name__ == "__main__":
+    unittest.main()
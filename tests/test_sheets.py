@@ -0,0 +1,84 @@
+"""Test Google Sheets fetching."""
+
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from typing import Any
+from unittest.mock import patch
+
+from src.sheets import Sheets
+
+CSV_BODY = "name,id\nalesiv,88229201\nÑandú,86272013\n".encode("utf-8")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Serve a CSV with an ETag, answering 304 when it matches."""
+
+    requests: list[str] = []
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Serve CSV_BODY."""
+        self.requests.append(self.headers.get("If-None-Match", ""))
+        if self.headers.get("If-None-Match") == '"v1"':
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header("ETag", '"v1"')
+        self.send_header("Content-Length", str(len(CSV_BODY)))
+        self.end_headers()
+        self.wfile.write(CSV_BODY)
+
+    # pylint: disable-next=redefined-builtin
+    def log_message(self, format: str, *args: Any):
+        """Keep test output clean."""
+
+
+class TestSheets(unittest.TestCase):
+    """Test Google Sheets fetching."""
+
+    def setUp(self):
+        """Start a local HTTP server and use an empty cache."""
+        self.server = HTTPServer(("127.0.0.1", 0), _Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_port}/pub?output=csv"
+        self.tmp = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        _Handler.requests = []
+
+    def tearDown(self):
+        """Stop the server and remove the cache."""
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp.cleanup()
+
+    def test_conditional_get(self):
+        """Check not modified sheets are served from the cache."""
+        sheets = Sheets()
+        with patch.multiple(sheets, cache_dir=self.tmp.name, ttl=0):
+            first = list(sheets.read_csv(self.url))
+            # Not modified: rows come from the body stored on disk
+            second = list(sheets.read_csv(self.url))
+
+        expected = [
+            {"name": "alesiv", "id": "88229201"},
+            {"name": "Ñandú", "id": "86272013"},
+        ]
+        self.assertEqual(first, expected)
+        self.assertEqual(second, expected)
+        self.assertEqual(_Handler.requests, ["", '"v1"'])
+
+    def test_fresh_body(self):
+        """Check bodies fresher than the TTL are used without asking the server."""
+        sheets = Sheets()
+        with patch.multiple(sheets, cache_dir=self.tmp.name, ttl=60):
+            first = list(sheets.read_csv(self.url))
+            second = list(sheets.read_csv(self.url))
+
+        self.assertEqual(first, second)
+        self.assertEqual(_Handler.requests, [""])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+"""Test the local SQLite store."""
+
+import os
+import tempfile
+import unittest
+from datetime import date
+from unittest.mock import patch
+
+from src.cs.group import Group
+from src.cs.league import League, LeagueRegistry
+from src.settings import config
+from tests.utils.mock import read_csv
+
+
+@patch.object(Group, "_read_csv", read_csv)
+class TestStore(unittest.TestCase):
+    """Test groups are saved to and loaded from the store."""
+
+    def setUp(self):
+        """Enable the store in a temporary directory."""
+        self.tmp = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        path = os.path.join(self.tmp.name, "league.db")
+        self.store_config = {"store": {"enabled": True, "path": path}}
+        self.cnf = LeagueRegistry().groups_config(2)["Rojo"]
+
+    def tearDown(self):
+        """Remove the store."""
+        self.tmp.cleanup()
+
+    def test_load(self):
+        """Check a group loaded from the store matches one built from sheets."""
+        with patch.dict(config, self.store_config):
+            group = Group("Rojo", self.cnf, season=2)
+            group.warm()
+            loaded = Group("Rojo", self.cnf, season=2)
+
+        with patch.object(Group, "_read_csv", side_effect=AssertionError):
+            self.assertTrue(loaded.load(max_age=60))
+            mydate = date.fromisoformat("2022-11-01")
+            self.assertEqual(loaded.players, group.players)
+            self.assertEqual(list(loaded.schedule), list(group.schedule))
+            self.assertEqual(list(loaded.outcome), list(group.outcome))
+            self.assertEqual(loaded.duels(mydate), group.duels(mydate))
+
+        self.assertFalse(loaded.load(max_age=-1))
+
+    def test_sheets_down(self):
+        """Check groups loaded from the store keep their data if sheets fail."""
+        with patch.dict(config, self.store_config):
+            Group("Rojo", self.cnf, season=2).warm()
+            loaded = Group("Rojo", self.cnf, season=2)
+            other = Group("Rojo", self.cnf, season=2)
+
+        self.assertTrue(loaded.load(max_age=60))
+        players, version = loaded.players, loaded.version
+        with patch.object(Group, "_read_csv", side_effect=OSError("sheets down")):
+            # pylint: disable-next=protected-access
+            self.assertEqual(League(season=2)._prefetch([loaded, other]), {})
+            self.assertFalse(loaded.refresh())
+            self.assertIs(loaded.players, players)
+            self.assertEqual(loaded.version, version)
+            self.assertIsNone(other.version)
+
+    def test_player_duels(self):
+        """Check played duels of a player are queried from the store."""
+        with patch.dict(config, self.store_config):
+            group = Group("Rojo", self.cnf, season=2)
+            outcome = group.outcome
+            store = group._store  # pylint: disable=protected-access
+
+        assert store is not None
+        player = group.players[0]
+        expected = [duel for duel in outcome if player in (duel.p1, duel.p2)]
+        got = store.player_duels(player.id, season=2)
+        self.assertEqual(len(got), len(expected))
+        self.assertEqual([row["day"] for row in got], sorted(r["day"] for r in got))
+
+
+if __name__ == "__main__":
+    unittest.main()
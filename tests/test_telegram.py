@@ -1,14 +1,93 @@
 """Test Telegram messages."""
 
+import asyncio
+import threading
+import time
 import unittest
 from datetime import date
+from typing import Any
 from unittest.mock import patch
 
+from telegram.error import RetryAfter
+
 from src.cs.group import Group
-from src.io.telegram_cs import Telegram
+from src.io import telegram_commands as commands
+from src.io.telegram_cs import Telegram, TelegramClient, _global_limiter
+from src.settings import config
 from tests.utils.mock import read_csv
 
 
+# pylint: disable=too-few-public-methods
+class _Message:
+    """Message received by the bot, keeping replies."""
+
+    def __init__(self, text: str):
+        """Build a message."""
+        self.text = text
+        self.replies: list[str] = []
+
+    async def reply_html(self, text: str, **_: Any):
+        """Keep reply."""
+        self.replies.append(text)
+
+    reply_text = reply_html
+
+
+class _Bot:
+    """Bot taking a while to send messages, flood controlled in some chats."""
+
+    def __init__(self, delay: float, flooded: set[int]):
+        """Build a bot."""
+        self.delay = delay
+        self.flooded = flooded
+        self.sent: list[int] = []
+
+    async def send_message(self, chat_id: int, **_: Any):
+        """Send message, asking to retry later the first time in flooded chats."""
+        self.sent.append(chat_id)
+        if chat_id in self.flooded:
+            self.flooded.remove(chat_id)
+            retry_after: Any = 0.2  # Seconds, int in the signature
+            raise RetryAfter(retry_after)
+        await asyncio.sleep(self.delay)
+
+
+class _ClientBot(_Bot):
+    """Bot recording its lifecycle and the loop it is used from."""
+
+    def __init__(self):
+        """Build a bot."""
+        super().__init__(delay=0, flooded=set())
+        self.initialized = 0
+        self.shutdown_called = False
+        self.loops: set[asyncio.AbstractEventLoop] = set()
+
+    async def initialize(self):
+        """Open connections, taking a while."""
+        self.initialized += 1
+        await asyncio.sleep(0.01)
+
+    async def shutdown(self):
+        """Close connections."""
+        self.shutdown_called = True
+
+    async def send_message(self, chat_id: int, **kwargs: Any):
+        """Send message, keeping the loop it was sent from."""
+        self.loops.add(asyncio.get_running_loop())
+        await super().send_message(chat_id, **kwargs)
+
+
+class _Update:
+    """Update holding a message."""
+
+    def __init__(self, text: str):
+        """Build an update."""
+        self.message = _Message(text)
+
+
+# pylint: enable=too-few-public-methods
+
+
 @patch.object(Group, "_read_csv", read_csv)
 class TestTelegram(unittest.TestCase):
     """Test Telegram messages."""
@@ -48,3 +127,131 @@ class TestTelegram(unittest.TestCase):
 
         got = telegram.create_msg(mydate)
         self.assertEqual(got, expected)
+
+    def test_cached_msg(self):
+        """Check messages are reused until group data changes."""
+        telegram = Telegram(season=2)
+        mydate = date.fromisoformat("2022-11-01")
+        expected = telegram.create_msg(mydate)
+
+        with patch.object(Group, "duels", side_effect=AssertionError):
+            self.assertEqual(telegram.create_msg(mydate), expected)
+
+        telegram.league.group("Rojo").invalidate()
+        with patch.object(
+            Group, "duels", autospec=True, side_effect=Group.duels
+        ) as duels:
+            self.assertEqual(telegram.create_msg(mydate), expected)
+        self.assertTrue(duels.called)
+
+    def test_commands_concurrent(self):
+        """Check commands are answered while another one waits for data."""
+        create_msg = Telegram.create_msg
+        fetching = threading.Event()
+
+        def _create_msg(telegram: Telegram, query_date: date, force: bool = False):
+            if force:
+                fetching.wait(5)  # Like downloading a sheet
+            return create_msg(telegram, query_date, force)
+
+        async def _commands() -> tuple[_Update, _Update]:
+            slow: Any = _Update("/schedule 01/11/22 2")
+            fast: Any = _Update("/results 01/11/22 2")
+            context: Any = None
+            task = asyncio.create_task(commands.schedule(slow, context))
+            await asyncio.sleep(0)
+
+            await asyncio.wait_for(commands.results(fast, context), 5)
+            self.assertFalse(task.done())
+            fetching.set()
+            await task
+            return slow, fast
+
+        with patch.object(Telegram, "create_msg", _create_msg):
+            slow, fast = asyncio.run(_commands())
+
+        self.assertIn("Duelos para hoy", slow.message.replies[0])
+        self.assertIn("Últimos resultados", fast.message.replies[0])
+
+    def test_player(self):
+        """Check /player replies with the duels of the closest player."""
+
+        async def _player(text: str) -> list[str]:
+            update: Any = _Update(text)
+            context: Any = None
+            await commands.player(update, context)
+            return update.message.replies
+
+        reply = asyncio.run(_player("/player alesvi 2"))[0]
+        self.assertIn(">alesiv</a></b> (Élite)", reply)
+        self.assertIn("Carquinyolis", reply)
+
+        self.assertIn("Several players match", asyncio.run(_player("/player ma 2"))[0])
+        self.assertEqual(asyncio.run(_player("/player zzz 2")), ["Nothing found"])
+        self.assertEqual(
+            asyncio.run(_player("/player")), ["Usage: /player <name> [season]"]
+        )
+
+    def test_send_async(self):
+        """Check messages go to every chat at once, retrying on flood control."""
+        chats = [{"id": chat_id} for chat_id in range(5)]
+        bot: Any = _Bot(delay=0.1, flooded={3})
+        cnf = {"groups": chats, "rate": {"global": 1000, "chat": 1000}}
+        _global_limiter.cache_clear()
+
+        with patch.dict(config["telegram"], cnf), patch.object(
+            Telegram, "create_msg", return_value=["msg"]
+        ):
+            start = time.perf_counter()
+            latencies = asyncio.run(Telegram(season=2).send_async(bot, date.today()))
+            elapsed = time.perf_counter() - start
+        _global_limiter.cache_clear()
+
+        self.assertEqual(sorted(latencies), list(range(5)))
+        self.assertEqual(sorted(bot.sent), [0, 1, 2, 3, 3, 4])
+        # Sent in parallel, the flooded chat waits for itself only
+        self.assertLess(elapsed, 0.5)
+        self.assertGreaterEqual(latencies[3], 0.3)
+        self.assertLess(max(latencies[c] for c in (0, 1, 2, 4)), 0.2)
+
+    def test_client(self):
+        """Check sends share one bot, in one loop, until the client is closed."""
+        bots: list[_ClientBot] = []
+
+        def _build_bot(_: Any) -> _ClientBot:
+            bots.append(_ClientBot())
+            return bots[-1]
+
+        client: Any = TelegramClient()
+        cnf = {"groups": [{"id": 1}], "rate": {"global": 1000, "chat": 1000}}
+        with patch.object(type(client), "_build_bot", _build_bot), patch.dict(
+            config["telegram"], cnf
+        ), patch.object(Telegram, "create_msg", return_value=["msg"]):
+            telegram = Telegram(season=2)
+            telegram.test(date.today(), date.today(), do_print=False, do_send=True)
+            asyncio.run(client.run_async(lambda bot: bot.send_message(chat_id=2)))
+            client.close()
+
+            self.assertEqual(len(bots), 1)
+            self.assertEqual(bots[0].sent, [1, 1, 2])
+            self.assertEqual(bots[0].initialized, 1)
+            self.assertEqual(len(bots[0].loops), 1)
+            self.assertTrue(bots[0].shutdown_called)
+
+            telegram.send(date.today())  # Started again after closing
+            client.close()
+            self.assertEqual(len(bots), 2)
+
+            async def _first_sends():
+                await asyncio.gather(
+                    *(
+                        client.run_async(lambda bot: bot.send_message(chat_id=3))
+                        for _ in range(5)
+                    )
+                )
+
+            asyncio.run(_first_sends())  # At once, before the bot exists
+            client.close()
+            self.assertEqual(len(bots), 3)
+            self.assertEqual(bots[2].initialized, 1)
+            self.assertEqual(bots[2].sent, [3] * 5)
@@ -0,0 +1,142 @@
+"""Test receiving Telegram updates through a webhook."""
+
+import asyncio
+import http.client
+import os
+import threading
+import unittest
+from typing import Any, Optional
+from unittest.mock import patch
+
+from telegram import Update
+from telegram.ext import CommandHandler, ContextTypes
+
+from src.io.telegram_cs import build_application
+from src.io.telegram_webhook import SECRET_HEADER, WebhookServer
+from src.settings import config
+from src.transport import cassette
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "telegram")
+SECRET = "s3cr3t"
+
+
+def _post(
+    address: tuple[str, int],
+    path: str,
+    body: bytes,
+    secret: str,
+    length: Optional[str] = None,
+) -> int:
+    """POST body to the server at address, return the HTTP status answered.
+
+    Content-Length is the one of body, unless given.
+    """
+    conn = http.client.HTTPConnection(*address, timeout=5)
+    try:
+        conn.putrequest("POST", path)
+        conn.putheader(SECRET_HEADER, secret)
+        conn.putheader("Content-Type", "application/json")
+        conn.putheader("Content-Length", str(len(body)) if length is None else length)
+        conn.endheaders(body)
+        return conn.getresponse().status
+    finally:
+        conn.close()
+
+
+class TestWebhook(unittest.TestCase):
+    """Test recorded updates posted to the webhook reach the handlers."""
+
+    def setUp(self):
+        """Answer Telegram from the cassette in fixtures."""
+        cassette.cache_clear()
+
+    def tearDown(self):
+        """Forget the cassette."""
+        cassette.cache_clear()
+
+    def test_webhook(self):
+        """Check updates with the secret token are dispatched, others rejected."""
+        with open(os.path.join(FIXTURES, "update_schedule.json"), "rb") as f:
+            update = f.read()
+
+        received: list[list[str]] = []
+
+        async def _schedule(_: Update, context: ContextTypes.DEFAULT_TYPE):
+            received.append(context.args or [])
+
+        # Name -> path, body, secret token and Content-Length if not the right one
+        requests: dict[str, tuple[str, bytes, str, Optional[str]]] = {
+            "wrong secret": ("/telegram", update, "guess", None),
+            "wrong path": ("/telegram/x", update, SECRET, None),
+            "not json": ("/telegram", b"{", SECRET, None),
+            "bad length": ("/telegram", update, SECRET, "x"),
+            "negative length": ("/telegram", update, SECRET, "-1"),
+            "update": ("/telegram", update, SECRET, None),
+        }
+
+        async def _run() -> dict[str, int]:
+            application = build_application()
+            application.add_handler(CommandHandler("schedule", _schedule))
+            server = WebhookServer(application, SECRET, port=0)
+            address = server.address
+
+            async with application:
+                await application.start()
+                server.start(asyncio.get_running_loop())
+                try:
+                    statuses = {
+                        name: await asyncio.to_thread(_post, address, *request)
+                        for name, request in requests.items()
+                    }
+                    while not received:
+                        await asyncio.sleep(0.01)
+                finally:
+                    server.stop()
+                    await application.stop()
+
+            return statuses
+
+        transport = {"mode": "replay", "cassettes": FIXTURES, "latency": 0}
+        with patch.dict(config, {"transport": transport}):
+            statuses = asyncio.run(asyncio.wait_for(_run(), 10))
+
+        self.assertEqual(
+            statuses,
+            {
+                "wrong secret": 403,
+                "wrong path": 404,
+                "not json": 400,
+                "bad length": 400,
+                "negative length": 400,
+                "update": 200,
+            },
+        )
+        self.assertEqual(received, [["01-11-2022"]])
+
+    def test_queue_timeout(self):
+        """Check updates the application does not take in time get a 503."""
+        with open(os.path.join(FIXTURES, "update_schedule.json"), "rb") as f:
+            update = f.read()
+
+        loop = asyncio.new_event_loop()
+        thread = threading.Thread(target=loop.run_forever, daemon=True)
+        thread.start()
+        application: Any = type("_App", (), {"bot": None, "update_queue": None})
+        application.update_queue = asyncio.Queue(maxsize=1)
+        application.update_queue.put_nowait(None)  # Full, so puts wait
+        server = WebhookServer(application, SECRET, port=0)
+        server.start(loop)
+        try:
+            with patch("src.io.telegram_webhook.QUEUE_TIMEOUT", 0.1):
+                status = _post(server.address, "/telegram", update, SECRET)
+        finally:
+            server.stop()
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+
+        self.assertEqual(status, 503)
+
+
+if __name__ == "__main__":
+    unittest.main()
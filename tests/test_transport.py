@@ -0,0 +1,135 @@
+"""Test recording and replaying exchanges with external services."""
+
+import json
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import requests
+from requests.adapters import BaseAdapter
+
+from src.settings import config
+from src.transport import CassetteHttp, cassette, mount
+
+
+class _Adapter(BaseAdapter):
+    """Answer every request with its URL, counting them."""
+
+    def __init__(self):
+        """Build an adapter."""
+        super().__init__()
+        self.sent = 0
+
+    # pylint: disable-next=too-many-arguments,too-many-positional-arguments
+    def send(
+        self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None
+    ):
+        """Return a response holding the request URL."""
+        self.sent += 1
+        resp = requests.Response()
+        resp.status_code = 200
+        resp.headers["Content-Type"] = "application/json"
+        resp.headers["Set-Cookie"] = "session=s3cr3t"
+        body = json.dumps({"url": request.url, "n": self.sent})
+        resp._content = body.encode()  # pylint: disable=protected-access
+        return resp
+
+    def close(self):
+        """Nothing to close."""
+
+
+class TestTransport(unittest.TestCase):
+    """Test exchanges are recorded and then replayed."""
+
+    def setUp(self):
+        """Keep cassettes in a temporary directory."""
+        self.tmp = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        cassette.cache_clear()
+
+    def tearDown(self):
+        """Remove cassettes."""
+        cassette.cache_clear()
+        self.tmp.cleanup()
+
+    def _config(self, mode: str) -> dict[str, dict[str, object]]:
+        """Return transport config for mode."""
+        return {"transport": {"mode": mode, "cassettes": self.tmp.name, "latency": 0.5}}
+
+    def _session(self, adapter: BaseAdapter) -> requests.Session:
+        """Return a session sending requests through adapter and the transport."""
+        session = requests.Session()
+        session.mount("https://", adapter)
+        return mount(session, "test")
+
+    def test_requests(self):
+        """Check requests sessions replay what they recorded, in order."""
+        url = "https://example.com/games?player=1"
+        live = _Adapter()
+        with patch.dict(config, self._config("record")):
+            session = self._session(live)
+            recorded = [session.get(url).json() for _ in range(2)]
+        self.assertEqual(live.sent, 2)
+
+        cassette.cache_clear()
+        offline = _Adapter()
+        with patch.dict(config, self._config("replay")), patch(
+            "src.transport.time.sleep"
+        ) as sleep:
+            session = self._session(offline)
+            replayed = [session.get(url).json() for _ in range(3)]
+
+            with self.assertRaises(RuntimeError):
+                session.get(f"{url}&unknown=1")
+
+        self.assertEqual(offline.sent, 0)
+        self.assertEqual(replayed, recorded + recorded[-1:])
+        sleep.assert_called_with(0.5)
+
+    def test_credentials(self):
+        """Check credentials and cookies are not recorded, and still replay."""
+        url = "https://example.com/login"
+        form = {"email": "me@example.com", "password": "hunter2", "token": "abc"}
+        with patch.dict(config, self._config("record")):
+            recorded = self._session(_Adapter()).post(url, data=form).json()
+
+        with open(cassette("test").path, "r", encoding="utf8") as f:
+            stored = f.read()
+        for secret in ("me@example.com", "hunter2", "s3cr3t"):
+            self.assertNotIn(secret, stored)
+
+        cassette.cache_clear()
+        form["password"] = "changed"
+        with patch.dict(config, self._config("replay")), patch(
+            "src.transport.time.sleep"
+        ):
+            resp = self._session(_Adapter()).post(url, data=form)
+
+        self.assertEqual(resp.json(), recorded)
+        self.assertNotIn("Set-Cookie", resp.headers)
+
+    def test_live(self):
+        """Check sessions are left alone in live mode."""
+        with patch.dict(config, self._config("live")):
+            live = _Adapter()
+            self.assertIs(self._session(live).get_adapter("https://"), live)
+
+    def test_httplib2(self):
+        """Check Google clients replay without a live client."""
+        body = b'{"items": []}'
+        with patch.dict(config, self._config("record")):
+            cassette("google").record("GET https://example.com/events", 200, {}, body)
+
+        cassette.cache_clear()
+        with patch.dict(config, self._config("replay")), patch(
+            "src.transport.time.sleep"
+        ):
+            resp, content = CassetteHttp("google", None).request(
+                "https://example.com/events"
+            )
+
+        self.assertEqual(resp.status, 200)
+        self.assertEqual(content, body)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -102,6 +102,7 @@ class TestTwitter(unittest.TestCase):
                 ),
                 (
                     "\n𝗥𝗼𝗷𝗼:\n"
+                    "FEIFER90 2 - 0 Pescatore\n"
                     "Rolente 0 - 2 dgsenande\n"
                     "saizechezarreta 0 - 2 Elige Juego\n\n"
                     "𝗩𝗲𝗿𝗱𝗲:\n"